@@ -0,0 +1,26 @@
+"""Post keyset index
+
+Revision ID: c5a8ab6c6fcc
+Revises: 4b98cee2a156
+Create Date: 2026-10-17 10:12:41.503120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a8ab6c6fcc'
+down_revision: Union[str, None] = '4b98cee2a156'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_post_creation_date_id', 'post', ['creation_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_creation_date_id', table_name='post')
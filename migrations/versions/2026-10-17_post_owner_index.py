@@ -0,0 +1,31 @@
+"""Post owner index
+
+Revision ID: 4289690c1f8b
+Revises: 203866158a94
+Create Date: 2026-10-17 19:42:08.553106
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4289690c1f8b'
+down_revision: Union[str, None] = '203866158a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_post_owner_id_creation_date_id',
+        'post',
+        ['owner_id', sa.text('creation_date DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_owner_id_creation_date_id', table_name='post')
@@ -0,0 +1,44 @@
+"""Post reaction counters
+
+Revision ID: ccb3d62d41cd
+Revises: c5a8ab6c6fcc
+Create Date: 2026-10-17 11:03:17.846215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ccb3d62d41cd'
+down_revision: Union[str, None] = 'c5a8ab6c6fcc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('post', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('post', sa.Column('dislike_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill counters from already existing reactions.
+    op.execute(
+        """
+        UPDATE post
+        SET like_count = counts.likes, dislike_count = counts.dislikes
+        FROM (
+            SELECT
+                post_id,
+                count(*) FILTER (WHERE type = 'like') AS likes,
+                count(*) FILTER (WHERE type = 'dislike') AS dislikes
+            FROM reaction
+            GROUP BY post_id
+        ) AS counts
+        WHERE post.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('post', 'dislike_count')
+    op.drop_column('post', 'like_count')
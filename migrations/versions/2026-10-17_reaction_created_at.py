@@ -0,0 +1,30 @@
+"""Reaction creation date
+
+Revision ID: 203866158a94
+Revises: d0253a02a997
+Create Date: 2026-10-17 18:05:12.417930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '203866158a94'
+down_revision: Union[str, None] = 'd0253a02a997'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Already existing reactions get the time of the migration.
+    op.add_column(
+        'reaction',
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('reaction', 'created_at')
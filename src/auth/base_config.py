@@ -1,13 +1,17 @@
 import uuid
+from typing import Optional
 
-from fastapi_users import FastAPIUsers
+import jwt
+from fastapi_users import BaseUserManager, FastAPIUsers, exceptions
 from fastapi_users.authentication import (
     AuthenticationBackend,
     CookieTransport,
     JWTStrategy,
 )
+from fastapi_users.jwt import decode_jwt
 
 import settings
+from auth.cache import get_cache_user, update_cache_user
 from auth.manager import get_user_manager
 from auth.models import User
 
@@ -18,8 +22,42 @@ LIFETIME_SEC = 3600
 cookie_transport = CookieTransport(cookie_max_age=LIFETIME_SEC, cookie_secure=False)
 
 
+class CachedJWTStrategy(JWTStrategy):
+    """JWT strategy that takes authenticated users from the cache instead of db."""
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[User, uuid.UUID]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+            parsed_id = user_manager.parse_id(user_id)
+        except (jwt.PyJWTError, exceptions.InvalidID):
+            return None
+
+        if not settings.USE_CACHE:
+            return await super().read_token(token, user_manager)
+
+        user, version = await get_cache_user(parsed_id)
+        if user is None:
+            try:
+                user = await user_manager.get(parsed_id)
+            except exceptions.UserNotExists:
+                return None
+            # Not cached if the user has been changed while it was loaded.
+            await update_cache_user(user, version)
+        return user
+
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=settings.JWT_SECRET, lifetime_seconds=LIFETIME_SEC)
+    return CachedJWTStrategy(secret=settings.JWT_SECRET, lifetime_seconds=LIFETIME_SEC)
 
 
 auth_backend = AuthenticationBackend(
@@ -29,3 +67,5 @@ auth_backend = AuthenticationBackend(
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
 current_user = fastapi_users.current_user()
+
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
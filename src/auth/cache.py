@@ -0,0 +1,108 @@
+import json
+from typing import Optional, Tuple
+from uuid import UUID
+
+from auth.models import User
+from cache_base import MISSING, build_key, redis_client
+
+
+USER_CACHE_LIFETIME_SEC = 30
+# Versions live much longer than cached users, so a load can't outlive the version it has read.
+USER_VERSION_LIFETIME_SEC = 24 * 60 * 60
+# Columns of the cached user, password hash is never cached.
+USER_CACHE_FIELDS = ("id", "email", "username", "is_active", "is_superuser", "is_verified")
+
+# Caches the user only if it hasn't been invalidated since the user was loaded from db.
+# KEYS[1] - cached user, KEYS[2] - version of the user.
+# ARGV[1] - user json, ARGV[2] - lifetime, ARGV[3] - version read before loading ('' - no version).
+SET_USER_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+_set_user_script = None
+
+
+def user_key(user_id: UUID) -> str:
+    """
+    Build key of the cached user.
+
+    :param user_id: User id in db.
+    :returns: Cache key.
+    """
+    return build_key("user", str(user_id))
+
+
+def user_version_key(user_id: UUID) -> str:
+    """
+    Build key of the user version, it is changed by every invalidation of the user.
+
+    :param user_id: User id in db.
+    :returns: Cache key.
+    """
+    return build_key("user", str(user_id), "version")
+
+
+async def get_cache_user(user_id: UUID) -> Tuple[Optional[User], str]:
+    """
+    Get cached user from the in-process cache or from redis.
+
+    :param user_id: User id in db.
+    :returns: A tuple with a User object not bound to any session (None if the user is not cached)
+    and version of the user to pass to `update_cache_user`.
+    """
+    key = user_key(user_id)
+    user_dict = redis_client.local.get(key)
+    if user_dict is MISSING:
+        deletions = redis_client.local.deletions
+        cached, version = await redis_client.redis.mget(key, user_version_key(user_id))
+        version = (version or b"").decode()
+        if cached is None:
+            return None, version
+        user_dict = json.loads(cached)
+        if redis_client.local.deletions == deletions:
+            redis_client.local.set(key, user_dict)
+    return User(**{**user_dict, "id": UUID(user_dict["id"])}), ""
+
+
+async def update_cache_user(user: User, version: str) -> None:
+    """
+    Add user to the cache unless it has been invalidated since `get_cache_user`.
+
+    :param user: A User object loaded from db after `get_cache_user`.
+    :param version: Version of the user returned by `get_cache_user`.
+    """
+    global _set_user_script
+    if _set_user_script is None:
+        _set_user_script = redis_client.redis.register_script(SET_USER_SCRIPT)
+
+    key = user_key(user.id)
+    user_dict = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+    user_dict["id"] = str(user.id)
+    deletions = redis_client.local.deletions
+    stored = await _set_user_script(
+        keys=[key, user_version_key(user.id)],
+        args=[json.dumps(user_dict), USER_CACHE_LIFETIME_SEC, version],
+    )
+    if stored and redis_client.local.deletions == deletions:
+        redis_client.local.set(key, user_dict)
+
+
+async def invalidate_cache_user(user_id: UUID) -> None:
+    """
+    Drop user from redis and from in-process caches of all workers.
+
+    Version of the user is changed as well, so users loaded before the change don't get into the cache.
+
+    :param user_id: User id in db.
+    """
+    key = user_key(user_id)
+    async with redis_client.redis.pipeline(transaction=True) as pipe:
+        pipe.incr(user_version_key(user_id))
+        pipe.expire(user_version_key(user_id), USER_VERSION_LIFETIME_SEC)
+        pipe.delete(key)
+        await pipe.execute()
+    await redis_client.invalidate(key)
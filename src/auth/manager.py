@@ -1,12 +1,16 @@
 import logging
 import uuid
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from fastapi import Depends, Request, Response
-from fastapi_users import BaseUserManager, UUIDIDMixin
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import BaseUserManager, UUIDIDMixin, exceptions
 
 import settings
+from auth.cache import invalidate_cache_user
 from auth.models import User
+from auth.password import password_helper
+from auth.schemas import UserCreate
 from auth.utils import get_user_db
 
 
@@ -32,6 +36,42 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     ):
         logger.info(f"User {user.id} has logged in.")
 
+    # Passwords are hashed and verified in the executor before calling the methods of
+    # BaseUserManager, which pick up the results from the password helper.
+
+    async def create(
+        self,
+        user_create: UserCreate,
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> User:
+        await password_helper.prehash(user_create.password)
+        return await super().create(user_create, safe, request)
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # The base method hashes the password of unknown user to mitigate timing attack.
+            await password_helper.prehash(credentials.password)
+        else:
+            await password_helper.preverify(credentials.password, user.hashed_password)
+        return await super().authenticate(credentials)
+
+    async def _update(self, user: User, update_dict: Dict[str, Any]) -> User:
+        if update_dict.get("password") is not None:
+            await password_helper.prehash(update_dict["password"])
+
+        # Every user update (including deactivation) goes through this method.
+        user = await super()._update(user, update_dict)
+        if settings.USE_CACHE:
+            await invalidate_cache_user(user.id)
+        return user
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None):
+        if settings.USE_CACHE:
+            await invalidate_cache_user(user.id)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
-    yield UserManager(user_db)
+    yield UserManager(user_db, password_helper)
@@ -0,0 +1,144 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi_users.password import PasswordHelper
+
+import settings
+
+
+# Module level helper and functions can be used by executor in another process.
+_password_helper = PasswordHelper()
+
+
+def _hash(password: str) -> str:
+    return _password_helper.hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return _password_helper.verify_and_update(plain_password, hashed_password)
+
+
+class AsyncPasswordHelper:
+    """
+    Password hashing and verification off the event loop.
+
+    Bcrypt takes tens of milliseconds of CPU, so it runs in the executor
+    and only limited amount of hashes are computed at once.
+    """
+
+    def __init__(self, executor: Executor, max_concurrency: int) -> None:
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash password.
+
+        :param password: Plain password.
+        :returns: Password hash.
+        """
+        return await self._run(_hash, password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify password and get its new hash if the hashing scheme is deprecated.
+
+        :param plain_password: Plain password.
+        :param hashed_password: Stored password hash.
+        :returns: A tuple with verification result and new hash (None if update is not needed).
+        """
+        return await self._run(_verify_and_update, plain_password, hashed_password)
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            # Created lazily to be bound to the running event loop.
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+
+# Results computed in the executor for the current request, looked up by the sync helper methods.
+_precomputed: ContextVar[Optional[Dict[Tuple[str, ...], Any]]] = ContextVar(
+    "precomputed_passwords", default=None
+)
+
+
+class PrecomputedPasswordHelper(PasswordHelper):
+    """
+    Password helper of the `UserManager`.
+
+    fastapi-users calls `hash` and `verify_and_update` synchronously, so their results
+    are computed in the executor beforehand (`prehash`, `preverify`) and only picked up
+    by the sync methods. Results that weren't precomputed are computed in place.
+    """
+
+    def __init__(self, async_helper: AsyncPasswordHelper) -> None:
+        super().__init__()
+        self.async_helper = async_helper
+
+    async def prehash(self, password: str) -> None:
+        """
+        Hash password in the executor for the following `hash` call.
+
+        :param password: Plain password.
+        """
+        self._results()[("hash", password)] = await self.async_helper.hash(password)
+
+    async def preverify(self, plain_password: str, hashed_password: str) -> None:
+        """
+        Verify password in the executor for the following `verify_and_update` call.
+
+        :param plain_password: Plain password.
+        :param hashed_password: Stored password hash.
+        """
+        self._results()[("verify", plain_password, hashed_password)] = (
+            await self.async_helper.verify_and_update(plain_password, hashed_password)
+        )
+
+    def hash(self, password: str) -> str:
+        results = _precomputed.get()
+        if results is not None and ("hash", password) in results:
+            return results.pop(("hash", password))
+        return super().hash(password)
+
+    def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        results = _precomputed.get()
+        key = ("verify", plain_password, hashed_password)
+        if results is not None and key in results:
+            return results.pop(key)
+        return super().verify_and_update(plain_password, hashed_password)
+
+    @staticmethod
+    def _results() -> Dict[Tuple[str, ...], Any]:
+        results = _precomputed.get()
+        if results is None:
+            # Every request runs in its own task with its own copy of the context.
+            results = {}
+            _precomputed.set(results)
+        return results
+
+
+def get_executor() -> Executor:
+    """
+    Create executor for password hashing according to settings.
+
+    :returns: Process pool or thread pool executor.
+    """
+    if settings.PASSWORD_HASHING_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS)
+    # Bcrypt releases the GIL while hashing, so threads are enough in most cases.
+    return ThreadPoolExecutor(
+        max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing"
+    )
+
+
+password_helper = PrecomputedPasswordHelper(
+    AsyncPasswordHelper(get_executor(), settings.PASSWORD_HASHING_MAX_CONCURRENCY)
+)
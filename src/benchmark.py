@@ -0,0 +1,425 @@
+"""
+Load test of the posts API.
+
+The app from `main.py` is driven in-process through ASGI (no network and no uvicorn)
+against db and redis configured in .env (e.g. the ones started by docker-compose),
+so results show the cost of the app code, db and redis only.
+
+Usage (from src/ folder):
+    python benchmark.py --concurrency 1,10,50 --requests 2000 --save baseline.json
+    python benchmark.py --concurrency 1,10,50 --requests 2000 --compare baseline.json
+
+Every run registers its own users and posts, so it can be repeated on the same db.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from main import app
+
+
+DEFAULT_MIX = "list=40,read=30,create=10,like=15,edit=5"
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+PAGES_COUNT = 5
+
+
+class ASGIClient:
+    """Minimal HTTP client calling an ASGI app directly."""
+
+    def __init__(self, asgi_app) -> None:
+        self.app = asgi_app
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[Dict[str, str]] = None,
+        query: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """
+        Make a request.
+
+        :param method: HTTP method.
+        :param path: Request path.
+        :param body: Request body.
+        :param headers: Request headers.
+        :param cookies: Cookies sent with the request.
+        :param query: Query parameters.
+        :returns: A tuple with status code, response headers and response body.
+        """
+        raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        if cookies:
+            cookie = "; ".join(f"{name}={value}" for name, value in cookies.items())
+            raw_headers.append((b"cookie", cookie.encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(query or {}).encode(),
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        request_sent = False
+        disconnected = asyncio.Event()
+        response = {"status": 0, "headers": [], "body": []}
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # The client stays connected until the response is sent.
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name.decode().lower(), value.decode()) for name, value in message["headers"]
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    disconnected.set()
+
+        await self.app(scope, receive, send)
+        return response["status"], response["headers"], b"".join(response["body"])
+
+
+class VirtualUser:
+    """Registered user making requests with its own cookies."""
+
+    def __init__(self, client: ASGIClient, email: str) -> None:
+        self.client = client
+        self.email = email
+        self.cookies: Dict[str, str] = {}
+        self.id: Optional[str] = None
+        self.post_ids: List[str] = []
+        self.reacted: set = set()
+
+    async def request(self, method: str, path: str, **kwargs) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """
+        Make a request with the user cookies and keep the cookies set by the response.
+
+        :param method: HTTP method.
+        :param path: Request path.
+        :returns: A tuple with status code, response headers and response body.
+        """
+        status, headers, body = await self.client.request(method, path, cookies=self.cookies, **kwargs)
+        for name, value in headers:
+            if name == "set-cookie":
+                cookie_name, _, cookie_value = value.split(";", 1)[0].partition("=")
+                self.cookies[cookie_name] = cookie_value
+        return status, headers, body
+
+    async def json_request(self, method: str, path: str, data: Any) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Make a request with JSON body."""
+        return await self.request(
+            method, path, body=json.dumps(data).encode(), headers={"content-type": "application/json"}
+        )
+
+
+class Benchmark:
+    """Mixed workload over a set of virtual users and posts."""
+
+    def __init__(self, client: ASGIClient, users: List[VirtualUser], mix: Dict[str, int]) -> None:
+        self.client = client
+        self.users = users
+        self.post_ids = [post_id for user in users for post_id in user.post_ids]
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+
+    async def run_operation(self, name: str, user: VirtualUser) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """
+        Make one request of the operation.
+
+        :param name: Operation name.
+        :param user: User making the request.
+        :returns: A tuple with status code, response headers and response body.
+        """
+        if name == "list":
+            skip = random.randrange(PAGES_COUNT) * 10
+            return await user.request("GET", "/posts", query={"skip": skip})
+        if name == "read":
+            return await user.request("GET", f"/posts/{random.choice(self.post_ids)}")
+        if name == "create":
+            response = await user.json_request(
+                "POST", "/posts", {"title": f"Post {uuid4().hex[:8]}", "description": "Benchmark post"}
+            )
+            if response[0] == 200:
+                post_id = json.loads(response[2])["data"]
+                user.post_ids.append(post_id)
+                self.post_ids.append(post_id)
+            return response
+        if name == "like":
+            # A post of another user the user hasn't reacted to yet.
+            for _ in range(10):
+                post_id = random.choice(self.post_ids)
+                if post_id not in user.reacted and post_id not in user.post_ids:
+                    user.reacted.add(post_id)
+                    return await user.request("POST", f"/posts/{post_id}/like")
+            return await user.request("GET", f"/posts/{random.choice(self.post_ids)}")
+        if name == "edit" and user.post_ids:
+            post_id = random.choice(user.post_ids)
+            return await user.json_request("PATCH", f"/posts/{post_id}", {"title": f"Edited {uuid4().hex[:8]}"})
+        if name == "edit":
+            # The user has no posts to edit yet.
+            return await self.run_operation("create", user)
+        raise ValueError(f"Unknown operation {name}")
+
+    async def run_level(self, concurrency: int, requests: int) -> Dict[str, Any]:
+        """
+        Run the workload with the given amount of concurrent users.
+
+        :param concurrency: Amount of concurrently working users.
+        :param requests: Total amount of requests.
+        :returns: A dict with throughput, latency percentiles and queries per request.
+        """
+        samples: Dict[str, List[Tuple[float, Optional[int]]]] = {name: [] for name in self.operations}
+        errors: Dict[str, int] = {name: 0 for name in self.operations}
+        remaining = requests
+
+        async def worker(user: VirtualUser) -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                name = random.choices(self.operations, self.weights)[0]
+                start = time.perf_counter()
+                status, headers, _ = await self.run_operation(name, user)
+                latency = time.perf_counter() - start
+                if status >= 400:
+                    errors[name] += 1
+                queries = None
+                for header, value in headers:
+                    if header == "server-timing":
+                        match = SERVER_TIMING_QUERIES.search(value)
+                        queries = int(match.group(1)) if match else None
+                samples[name].append((latency, queries))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(self.users[i % len(self.users)]) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        all_samples = [sample for operation in samples.values() for sample in operation]
+        result = summarize(all_samples)
+        result["throughput"] = round(len(all_samples) / elapsed, 2)
+        result["errors"] = sum(errors.values())
+        result["operations"] = {
+            name: {**summarize(operation_samples), "errors": errors[name]}
+            for name, operation_samples in samples.items()
+            if operation_samples
+        }
+        return result
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """
+    Get percentile by nearest rank.
+
+    :param values: Sorted values.
+    :param rank: Percentile rank from 0 to 100.
+    :returns: Percentile value.
+    """
+    index = max(0, min(len(values) - 1, round(rank / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(samples: List[Tuple[float, Optional[int]]]) -> Dict[str, Any]:
+    """
+    Summarize samples of requests.
+
+    :param samples: A list of tuples with latency and amount of db queries.
+    :returns: A dict with amount of requests, latency percentiles in milliseconds and queries per request.
+    """
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    queries = [count for _, count in samples if count is not None]
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 3) if queries else None,
+    }
+
+
+async def create_users(client: ASGIClient, users_count: int, posts_per_user: int) -> List[VirtualUser]:
+    """
+    Register and log in users, each of them creates some posts.
+
+    :param client: ASGI client.
+    :param users_count: Amount of users.
+    :param posts_per_user: Amount of posts created by each user.
+    :returns: A list of logged in users.
+    """
+    run_id = uuid4().hex[:8]
+    password = uuid4().hex
+    users = []
+    for i in range(users_count):
+        user = VirtualUser(client, f"bench-{run_id}-{i}@example.com")
+        status, _, body = await user.json_request(
+            "POST",
+            "/auth/register",
+            {"email": user.email, "password": password, "username": f"bench-{run_id}-{i}"},
+        )
+        if status != 201:
+            raise SystemExit(f"Can't register user: {status} {body.decode()}")
+        user.id = json.loads(body)["id"]
+        status, _, body = await user.request(
+            "POST",
+            "/auth/jwt/login",
+            body=urlencode({"username": user.email, "password": password}).encode(),
+            headers={"content-type": "application/x-www-form-urlencoded"},
+        )
+        if status >= 400:
+            raise SystemExit(f"Can't log in: {status} {body.decode()}")
+        for j in range(posts_per_user):
+            status, _, body = await user.json_request(
+                "POST", "/posts", {"title": f"Seed post {j}", "description": "Benchmark seed post"}
+            )
+            user.post_ids.append(json.loads(body)["data"])
+        users.append(user)
+    return users
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse positive integer argument.
+
+    :param value: Argument value.
+    :returns: Parsed integer.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """
+    Parse workload mix.
+
+    :param mix: Comma separated "operation=weight" pairs.
+    :returns: A dictionary with operation as a key and its weight as a value.
+    """
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ("list", "read", "create", "like", "edit"):
+            raise argparse.ArgumentTypeError(f"Unknown operation {name}")
+        try:
+            weights[name] = int(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Weight of {name} is not an integer")
+        if weights[name] < 0:
+            raise argparse.ArgumentTypeError(f"Weight of {name} is negative")
+    if not sum(weights.values()):
+        raise argparse.ArgumentTypeError("At least one weight must be positive")
+    return weights
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    """
+    Print results of every concurrency level, compared with the baseline if it is given.
+
+    :param results: Benchmark results.
+    :param baseline: Results of a previous run.
+    """
+    for level, result in results["levels"].items():
+        base = (baseline or {}).get("levels", {}).get(level)
+        print(f"\nConcurrency {level}: {result['throughput']} req/s, {result['errors']} errors")
+        print(f"{'operation':<10}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+        rows = [("all", result, base)] + [
+            (name, operation, (base or {}).get("operations", {}).get(name))
+            for name, operation in result["operations"].items()
+        ]
+        for name, row, base_row in rows:
+            print(
+                f"{name:<10}{row['requests']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{str(row['queries_per_request']):>10}"
+            )
+            if base_row:
+                deltas = [
+                    f"{key} {(row[key] - base_row[key]) / base_row[key] * 100:+.1f}%"
+                    for key in ("p50_ms", "p95_ms", "p99_ms")
+                    if base_row[key]
+                ]
+                print(f"{'':<10}vs baseline: {', '.join(deltas)}")
+        if base:
+            change = (result["throughput"] - base["throughput"]) / base["throughput"] * 100
+            print(f"Throughput vs baseline: {change:+.1f}%")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    client = ASGIClient(app)
+    await app.router.startup()
+    try:
+        users = await create_users(client, args.users, args.posts_per_user)
+        benchmark = Benchmark(client, users, args.mix)
+        if args.warmup:
+            await benchmark.run_level(max(args.concurrency), args.warmup)
+        levels = {}
+        for concurrency in args.concurrency:
+            print(f"Running {args.requests} requests with concurrency {concurrency}", file=sys.stderr)
+            levels[str(concurrency)] = await benchmark.run_level(concurrency, args.requests)
+    finally:
+        await app.router.shutdown()
+    return {
+        "mix": args.mix,
+        "requests": args.requests,
+        "users": args.users,
+        "levels": levels,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the posts API.")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [positive_int(level) for level in value.split(",")],
+        default=[1, 10, 50],
+        help="Comma separated concurrency levels.",
+    )
+    parser.add_argument(
+        "--requests", type=positive_int, default=1000, help="Requests per concurrency level."
+    )
+    parser.add_argument("--warmup", type=int, default=100, help="Requests made before measuring.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="Workload mix.")
+    parser.add_argument("--users", type=positive_int, default=20)
+    parser.add_argument("--posts-per-user", type=positive_int, default=5)
+    parser.add_argument("--seed", type=int, help="Random seed for repeatable workloads.")
+    parser.add_argument("--save", help="Save results as JSON baseline.")
+    parser.add_argument("--compare", help="Compare results with JSON baseline.")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    results = asyncio.run(run(args))
+    print_report(results, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,499 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
+
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
-from redis import asyncio as aioredis
+from redis.exceptions import RedisError
 import settings
+from metrics import InstrumentedRedis
+
+
+logger = logging.getLogger("uvicorn")
+
+MISSING = object()
+
+
+class LocalCache:
+    """
+    In-process LRU cache with TTL.
+
+    Used as the first level of cache in front of redis,
+    so values are shared only inside one worker.
+    A value can depend on other keys (tags): deleting any of them deletes the value.
+    """
+
+    def __init__(self, max_size: int, lifetime_sec: float) -> None:
+        self.max_size = max_size
+        self.lifetime_sec = lifetime_sec
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, Sequence[Hashable]]]" = OrderedDict()
+        # Keys of the values depending on every tag.
+        self._tagged: Dict[Hashable, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Changes on every deletion, a value read elsewhere before a deletion must not be put after it.
+        self.deletions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get value by key.
+
+        :param key: Cache key.
+        :returns: Cached value or MISSING if there is no fresh value.
+        """
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        lifetime_sec: Optional[float] = None,
+        tags: Sequence[Hashable] = (),
+    ) -> None:
+        """
+        Set value by key, least recently used values are evicted when cache is full.
+
+        :param key: Cache key.
+        :param value: Value to cache.
+        :param lifetime_sec: Value lifetime, default lifetime of the cache if not given.
+        :param tags: Keys the value depends on.
+        """
+        if lifetime_sec is None:
+            lifetime_sec = self.lifetime_sec
+        expires_at = time.monotonic() + lifetime_sec
+        self._remove(key)
+        self._data[key] = (expires_at, value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._data) > self.max_size:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def delete(self, *keys: Hashable) -> None:
+        """
+        Delete values by keys and the values depending on them.
+
+        :param keys: Cache keys.
+        """
+        self.deletions += 1
+        for key in keys:
+            self._remove(key)
+            for dependent in self._tagged.pop(key, ()):
+                self._remove(dependent)
+
+    def clear(self) -> None:
+        """Delete all values."""
+        self.deletions += 1
+        self._data.clear()
+        self._tagged.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        for tag in item[2]:
+            dependents = self._tagged.get(tag)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._tagged[tag]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get cache counters.
+
+        :returns: A dict with amount of hits, misses, evictions and current size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+        }
 
 
 class RedisClient:
     def __init__(self, url: str) -> None:
         self.redis = None
         self.url = url
-    
+        self.local = LocalCache(settings.L1_CACHE_MAX_SIZE, settings.L1_CACHE_LIFETIME_SEC)
+        self._listener = None
+
     async def connect_redis(self) -> None:
-        self.redis = await aioredis.from_url(f"redis://{self.url}", encoding="utf8")
+        self.redis = await InstrumentedRedis.from_url(f"redis://{self.url}", encoding="utf8")
         FastAPICache.init(RedisBackend(self.redis), prefix="fastapi-cache")
+        self._listener = asyncio.create_task(self._listen_invalidations())
+
+    @asynccontextmanager
+    async def connected(self) -> AsyncIterator["RedisClient"]:
+        """
+        Connect to redis for the time of the block, for command line scripts.
+
+        Unlike `connect_redis` doesn't listen for invalidations of the local cache.
+        """
+        self.redis = await InstrumentedRedis.from_url(f"redis://{self.url}", encoding="utf8")
+        try:
+            yield self
+        finally:
+            await self.redis.close()
+            self.redis = None
+
+    async def disconnect_redis(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        if self.redis is not None:
+            await self.redis.close()
+
+    async def invalidate(self, *keys: str) -> None:
+        """
+        Drop values from in-process caches of all workers.
+
+        :param keys: Keys of the local cache.
+        """
+        self.local.delete(*keys)
+        await self.redis.publish(settings.CACHE_INVALIDATION_CHANNEL, json.dumps(keys))
+
+    async def _listen_invalidations(self) -> None:
+        """Drop local cache values invalidated by other workers."""
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        try:
+                            self.local.delete(*json.loads(message["data"]))
+                        except Exception:
+                            # Keys of the message are unknown, so the whole local cache is dropped.
+                            logger.exception(f"Bad cache invalidation message: {message['data']!r}")
+                            self.local.clear()
+            except RedisError as e:
+                logger.warning(f"Cache invalidation listener disconnected: {e}")
+            # Invalidations could be missed while there was no subscription.
+            self.local.clear()
+            await asyncio.sleep(1)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads of the same key.
+
+    Inside a worker concurrent callers share one future, across workers
+    only the holder of a short redis lock loads the value while others
+    wait for it to appear in the cache.
+    """
+
+    # Deletes the lock only if it is still held by the same loader.
+    RELEASE_LOCK_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client: RedisClient) -> None:
+        self.client = client
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._release_lock = None
+
+    async def do(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        read_cached: Callable[[], Awaitable[Optional[Any]]],
+    ) -> Any:
+        """
+        Load value by key once for all concurrent callers.
+
+        If the caller loading the value is cancelled, one of the waiting callers
+        loads it with its own `load` instead.
+
+        :param key: Key of the loaded value.
+        :param load: Loads the value and stores it in redis.
+        :param read_cached: Reads the value from redis, returns None if there is no value.
+        :returns: Loaded value.
+        """
+        future = self._futures.get(key)
+        while future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # The waiter itself is cancelled.
+                    raise
+            # The loader has been cancelled, one of the waiters takes over loading.
+            future = self._futures.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await self._load_locked(key, load, read_cached)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark exception as retrieved, waiters (if there are any) get it anyway.
+            future.exception()
+            raise
+        except asyncio.CancelledError:
+            # Waiters don't get the cancellation, they load the value again.
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    async def _load_locked(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        read_cached: Callable[[], Awaitable[Optional[Any]]],
+    ) -> Any:
+        lock_key = build_key("lock", key)
+        token = uuid4().hex
+        redis = self.client.redis
+        if await redis.set(lock_key, token, nx=True, px=settings.SINGLE_FLIGHT_LOCK_LIFETIME_MS):
+            try:
+                return await load()
+            finally:
+                if self._release_lock is None:
+                    self._release_lock = redis.register_script(self.RELEASE_LOCK_SCRIPT)
+                await self._release_lock(keys=[lock_key], args=[token])
+
+        # Another worker is loading the value: wait for it to appear in the cache.
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_LIFETIME_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL_SEC)
+            cached = await read_cached()
+            if cached is not None:
+                return cached
+        # Loader has died or is too slow, load the value by ourselves.
+        return await load()
+
+
+class TagCache:
+    """
+    Cache of serialized responses invalidated by tags.
+
+    Every tag has a version in redis. A cached response keeps versions of its tags
+    as they were before the response was loaded and is valid while they stay the same,
+    so invalidating a tag is just setting its version to the next generation.
+    Hot responses are also kept in the in-process cache, where they depend on the keys
+    of their tags and are dropped by invalidations published to all workers.
+    """
+
+    # KEYS[1] - response hash.
+    # Returns nil if the response is not cached or is outdated, {etag, body, tag keys} otherwise.
+    # Tag versions are read by keys stored in the response, not passed in KEYS: tags of a response
+    # are known only after it is loaded. Scripts accessing undeclared keys are allowed only by a single
+    # redis instance (not by Redis Cluster), which is what REDIS_URL points at.
+    GET_SCRIPT = """
+    local entry = redis.call('HMGET', KEYS[1], 'etag', 'body', 'tags', 'versions')
+    if not entry[1] then
+        return nil
+    end
+    local versions = cjson.decode(entry[4])
+    for i, tag_key in ipairs(cjson.decode(entry[3])) do
+        if (redis.call('GET', tag_key) or '') ~= versions[i] then
+            return nil
+        end
+    end
+    return {entry[1], entry[2], entry[3]}
+    """
+
+    # KEYS[1] - response hash, KEYS[2..] - tag versions.
+    # ARGV[1] - lifetime, ARGV[2] - etag, ARGV[3] - body, ARGV[4] - generation before loading,
+    # ARGV[5..] - tag versions before loading ('*' - not known).
+    # Response is not stored if any of its tags has been invalidated while it was loaded:
+    # known tags must keep their versions, tags found in the response must not have versions
+    # newer than the generation.
+    SET_SCRIPT = """
+    local generation = tonumber(ARGV[4])
+    local tag_keys, versions = {}, {}
+    for i = 2, #KEYS do
+        local version = redis.call('GET', KEYS[i]) or ''
+        if ARGV[i + 3] == '*' then
+            if version ~= '' and tonumber(version) > generation then
+                return 0
+            end
+        elseif ARGV[i + 3] ~= version then
+            return 0
+        end
+        tag_keys[#tag_keys + 1] = KEYS[i]
+        versions[#versions + 1] = version
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call(
+        'HSET', KEYS[1], 'etag', ARGV[2], 'body', ARGV[3],
+        'tags', cjson.encode(tag_keys), 'versions', cjson.encode(versions)
+    )
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    return 1
+    """
+
+    # KEYS[1] - generation, KEYS[2..] - tag versions. ARGV[1] - current time in microseconds, ARGV[2] - lifetime.
+    # Invalidated tags get the next generation as their version. A lost generation starts from the current time,
+    # so versions never go back to old values.
+    INVALIDATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+    local version = redis.call('INCR', KEYS[1])
+    for i = 2, #KEYS do
+        redis.call('SET', KEYS[i], version, 'EX', ARGV[2])
+    end
+    return version
+    """
+
+    # Incremented by every invalidation, the latest version of any tag.
+    GENERATION_KEY = "tags:generation"
+
+    def __init__(self, client: RedisClient) -> None:
+        self.client = client
+        self._get = None
+        self._set = None
+        self._invalidate = None
+
+    def _register_scripts(self) -> None:
+        if self._get is None:
+            redis = self.client.redis
+            self._get = redis.register_script(self.GET_SCRIPT)
+            self._set = redis.register_script(self.SET_SCRIPT)
+            self._invalidate = redis.register_script(self.INVALIDATE_SCRIPT)
+
+    async def get(self, key: str, etags: Sequence[str] = ()) -> Optional[Tuple[str, Optional[bytes]]]:
+        """
+        Get cached response, hot responses are served from the in-process cache.
+
+        :param key: Key of the response.
+        :param etags: ETags the client already has.
+        :returns: None if there is no valid cached response, otherwise a tuple with
+        ETag and body (None if the client already has the response).
+        """
+        local = self.client.local
+        local_key = build_key("response", key)
+        cached = local.get(local_key)
+        if cached is MISSING:
+            self._register_scripts()
+            deletions = local.deletions
+            entry = await self._get(keys=[local_key])
+            if entry is None:
+                return None
+            etag, body, tag_keys = entry
+            cached = etag.decode(), body
+            if local.deletions == deletions:
+                # Invalidated tags drop the response from the in-process cache as well.
+                local.set(local_key, cached, tags=json.loads(tag_keys))
+
+        etag, body = cached
+        if etag in etags or "*" in etags:
+            return etag, None
+        return etag, body
+
+    async def snapshot(self, *tags: str) -> Tuple[str, List[str]]:
+        """
+        Read versions the response depends on, must be called before loading the response.
+
+        :param tags: Tags of the response known before loading.
+        :returns: A tuple with generation and versions of the tags.
+        """
+        generation, *versions = await self.client.redis.mget(
+            self.GENERATION_KEY, *(build_key("tag", tag) for tag in tags)
+        )
+        return (
+            (generation or b"0").decode(),
+            [(version or b"").decode() for version in versions],
+        )
+
+    async def set(
+        self,
+        key: str,
+        etag: str,
+        body: bytes,
+        tags: List[str],
+        snapshot: Tuple[str, List[str]],
+        lifetime_sec: Optional[int] = None,
+    ) -> None:
+        """
+        Cache the response if nothing it depends on has changed since the snapshot.
+
+        :param key: Key of the response.
+        :param etag: ETag of the response.
+        :param body: Serialized response.
+        :param tags: Tags of the response, the ones passed to `snapshot` go first.
+        :param snapshot: Result of `snapshot` called before loading the response.
+        :param lifetime_sec: Response lifetime, RESPONSE_CACHE_LIFETIME_SEC if not given.
+        """
+        if lifetime_sec is None:
+            lifetime_sec = settings.RESPONSE_CACHE_LIFETIME_SEC
+        self._register_scripts()
+        local = self.client.local
+        deletions = local.deletions
+        generation, versions = snapshot
+        unknown = len(tags) - len(versions)
+        tag_keys = [build_key("tag", tag) for tag in tags]
+        stored = await self._set(
+            keys=[build_key("response", key), *tag_keys],
+            args=[
+                lifetime_sec,
+                etag,
+                body,
+                generation,
+                *versions,
+                # Tags found only in the loaded response weren't read beforehand,
+                # they are checked against the generation.
+                *["*"] * unknown,
+            ],
+        )
+        if stored and local.deletions == deletions:
+            local.set(
+                build_key("response", key),
+                (etag, body),
+                min(lifetime_sec, local.lifetime_sec),
+                tags=tag_keys,
+            )
+
+    async def invalidate(self, *tags: str) -> None:
+        """
+        Invalidate all cached responses with any of the tags.
+
+        :param tags: Tags to invalidate.
+        """
+        self._register_scripts()
+        tag_keys = [build_key("tag", tag) for tag in tags]
+        await self._invalidate(
+            keys=[self.GENERATION_KEY, *tag_keys],
+            args=[int(time.time() * 1_000_000), settings.TAG_VERSION_LIFETIME_SEC],
+        )
+        # Responses in the in-process caches of all workers depend on the tag keys.
+        await self.client.invalidate(*tag_keys)
 
 
 def build_key(*args) -> str:
@@ -26,3 +508,5 @@ def build_key(*args) -> str:
 
 
 redis_client = RedisClient(settings.REDIS_URL)
+single_flight = SingleFlight(redis_client)
+tag_cache = TagCache(redis_client)
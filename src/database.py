@@ -1,13 +1,24 @@
-from typing import Any, AsyncGenerator, Dict
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Dict
+from uuid import uuid4
+from fastapi import Request
 from sqlalchemy import inspect
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 import settings
+from metrics import instrument_engine
 
 
 DATABASE_URL = f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+REPLICA_DATABASE_URLS = [
+    f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASS}@{host}/{settings.DB_NAME}"
+    for host in settings.DB_REPLICA_HOSTS
+]
 
 
 class Base(DeclarativeBase):
@@ -15,16 +26,144 @@ class Base(DeclarativeBase):
         """
         Convert SQLAlchemy model object to a dict.
 
-        :returns: A dict with column name as a key and column values as a value.
+        :returns: A dict with column name as a key and column values as a value
+        (deferred columns are skipped).
         """
-        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
+        return {
+            c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs if not c.deferred
+        }
 
 
-engine = create_async_engine(DATABASE_URL)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Connection pool that measures time spent waiting for a connection."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_time = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool gauges.
+
+        :returns: A dict with amount of checked out, idle and overflow connections
+        and time spent waiting for connections.
+        """
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "wait_count": self.wait_count,
+            "wait_time_total_sec": round(self.wait_time_total, 6),
+            "wait_time_max_sec": round(self.wait_time_max, 6),
+        }
+
+
+def get_engine_options() -> Dict[str, Any]:
+    """
+    Build engine options from settings.
+
+    :returns: Keyword arguments for `create_async_engine`.
+    """
+    if settings.DB_PGBOUNCER:
+        # PgBouncer in transaction pooling mode pools connections by itself and
+        # may run every transaction on another server connection,
+        # so prepared statements can't be cached and must have unique names.
+        return {
+            "poolclass": NullPool,
+            "connect_args": {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        }
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "connect_args": {
+            # asyncpg's own statement cache and SQLAlchemy's prepared statement cache.
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+
+
+engine = create_async_engine(DATABASE_URL, **get_engine_options())
 
 async_session_maker = sessionmaker(engine, class_=AsyncSession)
 
+replica_engines = [create_async_engine(url, **get_engine_options()) for url in REPLICA_DATABASE_URLS]
+for instrumented_engine in (engine, *replica_engines):
+    instrument_engine(instrumented_engine)
+# Replicas are used in turn.
+_replica_session_makers = itertools.cycle(
+    [sessionmaker(replica_engine, class_=AsyncSession) for replica_engine in replica_engines]
+)
+
+
+def get_read_session_maker() -> sessionmaker:
+    """
+    Get session maker for read-only queries.
+
+    :returns: Session maker of the next replica, session maker of the primary if there are no replicas.
+    """
+    if not replica_engines:
+        return async_session_maker
+    return next(_replica_session_makers)
+
+
+def is_primary(session: AsyncSession) -> bool:
+    """
+    Check whether the session reads from the primary db.
+
+    :param session: SQLAlchemy session.
+    :returns: False if the session is bound to a replica.
+    """
+    return session.bind is engine
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Get gauges of the connection pool of this worker.
+
+    :returns: A dict with pool gauges (empty if connections are not pooled by the app).
+    """
+    if isinstance(engine.pool, InstrumentedPool):
+        return engine.pool.stats()
+    return {}
+
 
 async def get_async_session() -> AsyncGenerator[AsyncGenerator, None]:
     async with async_session_maker() as session:
         yield session
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get session for read-only queries.
+
+    Clients that have recently written something read from the primary,
+    so they see their writes even if replicas are behind.
+    """
+    if settings.READ_YOUR_WRITES_COOKIE in request.cookies:
+        session_maker = async_session_maker
+    else:
+        session_maker = get_read_session_maker()
+    async with session_maker() as session:
+        yield session
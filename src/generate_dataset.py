@@ -0,0 +1,249 @@
+"""
+Synthetic dataset for scale testing.
+
+Usage (from src/ folder, after `alembic upgrade head`):
+    python generate_dataset.py --users 100000 --posts 1000000 --reactions 10000000
+    python generate_dataset.py --posts 100000 --reactions 1000000 --zipf 1.2 --seed 1
+
+Users, posts and reactions are added to the existing data with COPY in batches.
+Amount of reactions per post follows Zipf distribution (a few hot posts get most of reactions),
+denormalized reaction counters of the posts match the generated reactions.
+All generated users have the same password (`--password`).
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+import asyncpg
+from fastapi_users.password import PasswordHelper
+
+import settings
+from cache_base import redis_client
+from posts.cache import invalidate_posts
+from posts.models import ReactionType
+
+
+COPY_BATCH_SIZE = 100_000
+USER_COLUMNS = ["id", "email", "hashed_password", "is_active", "is_superuser", "is_verified", "username"]
+POST_COLUMNS = [
+    "id",
+    "owner_id",
+    "title",
+    "description",
+    "creation_date",
+    "last_update_date",
+    "like_count",
+    "dislike_count",
+]
+REACTION_COLUMNS = ["user_id", "post_id", "type", "created_at"]
+
+
+def zipf_counts(items_count: int, total: int, exponent: float, max_count: int) -> List[int]:
+    """
+    Split total amount between items by Zipf distribution.
+
+    :param items_count: Amount of items.
+    :param total: Amount to split.
+    :param exponent: Skew, 0 - uniform, the bigger the more goes to the first items.
+    :param max_count: Maximum amount per item.
+    :returns: A list with amount per item, hottest items first.
+    """
+    weights = [1 / rank**exponent for rank in range(1, items_count + 1)]
+    weights_sum = sum(weights)
+    return [min(max_count, round(total * weight / weights_sum)) for weight in weights]
+
+
+def random_uuid() -> UUID:
+    """Random UUID taken from the seeded generator, so datasets are repeatable."""
+    return UUID(int=random.getrandbits(128), version=4)
+
+
+def batches(records: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    """
+    Group records into batches.
+
+    :param records: Records.
+    :param size: Batch size.
+    :returns: An iterator of lists of records.
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_users(run_id: str, count: int, hashed_password: str) -> Iterator[tuple]:
+    """
+    Generate user rows.
+
+    :param run_id: Id of the run, makes emails unique.
+    :param count: Amount of users.
+    :param hashed_password: Password hash of every user.
+    :returns: An iterator of user records.
+    """
+    for i in range(count):
+        name = f"user-{run_id}-{i}"
+        yield (random_uuid(), f"{name}@example.com", hashed_password, True, False, False, name)
+
+
+def generate_posts(
+    owner_ids: Sequence[UUID], posts: Sequence[Tuple[UUID, int, int, int, datetime]]
+) -> Iterator[tuple]:
+    """
+    Generate post rows.
+
+    :param owner_ids: Users ids.
+    :param posts: A list of tuples with post id, owner index, amount of likes and dislikes, creation date.
+    :returns: An iterator of post records.
+    """
+    for post_id, owner_index, like_count, dislike_count, creation_date in posts:
+        yield (
+            post_id,
+            owner_ids[owner_index],
+            f"Post {post_id.hex[:8]}",
+            "Generated post",
+            creation_date,
+            creation_date,
+            like_count,
+            dislike_count,
+        )
+
+
+def generate_reactions(
+    user_ids: Sequence[UUID], posts: Sequence[Tuple[UUID, int, int, int, datetime]], now: datetime
+) -> Iterator[tuple]:
+    """
+    Generate reaction rows, every post gets its amount of likes and dislikes from distinct users.
+
+    :param user_ids: Users ids.
+    :param posts: A list of tuples with post id, owner index, amount of likes and dislikes, creation date.
+    :param now: Reactions are made between creation of the post and this time.
+    :returns: An iterator of reaction records.
+    """
+    for post_id, owner_index, like_count, dislike_count, creation_date in posts:
+        count = like_count + dislike_count
+        if not count:
+            continue
+        # One extra user in case the owner is sampled, owners don't react to own posts.
+        sampled = random.sample(range(len(user_ids)), min(count + 1, len(user_ids)))
+        reacted = [user_index for user_index in sampled if user_index != owner_index]
+        for n, user_index in enumerate(reacted[:count]):
+            reaction = ReactionType.like if n < like_count else ReactionType.dislike
+            created_at = creation_date + (now - creation_date) * random.random()
+            yield (user_ids[user_index], post_id, reaction.name, created_at)
+
+
+async def copy(
+    connection: asyncpg.Connection, table: str, columns: List[str], records: Iterator[tuple], batch_size: int
+) -> int:
+    """
+    Load records into the table with COPY in batches.
+
+    :param connection: Db connection.
+    :param table: Table name.
+    :param columns: Columns of the records.
+    :param records: Records to load.
+    :param batch_size: Amount of records loaded by one COPY.
+    :returns: Amount of loaded records.
+    """
+    loaded = 0
+    started = time.monotonic()
+    for batch in batches(records, batch_size):
+        await connection.copy_records_to_table(table, records=batch, columns=columns)
+        loaded += len(batch)
+        rate = loaded / max(time.monotonic() - started, 1e-9)
+        print(f"{table}: {loaded} rows loaded ({rate:.0f} rows/s)", file=sys.stderr)
+    return loaded
+
+
+async def generate(args: argparse.Namespace) -> None:
+    """
+    Generate the dataset and load it into db.
+
+    :param args: Command line arguments.
+    """
+    run_id = random_uuid().hex[:8]
+    hashed_password = PasswordHelper().hash(args.password)
+    connection = await asyncpg.connect(
+        host=settings.DB_HOST,
+        port=int(settings.DB_PORT),
+        user=settings.DB_USER,
+        password=settings.DB_PASS,
+        database=settings.DB_NAME,
+    )
+    try:
+        users = list(generate_users(run_id, args.users, hashed_password))
+        user_ids = [user[0] for user in users]
+        await copy(connection, "user", USER_COLUMNS, iter(users), args.batch_size)
+        del users
+
+        # Reaction counters of every post are decided beforehand, so posts are loaded
+        # with counters that match the reactions loaded after them.
+        counts = zipf_counts(args.posts, args.reactions, args.zipf, args.users - 1)
+        # Hot posts are scattered over time and authors.
+        random.shuffle(counts)
+        now = datetime.utcnow()
+        posts = []
+        for count in counts:
+            like_count = sum(1 for _ in range(count) if random.random() < args.like_ratio)
+            creation_date = now - timedelta(seconds=random.uniform(0, args.days * 24 * 60 * 60))
+            owner_index = random.randrange(args.users)
+            posts.append((random_uuid(), owner_index, like_count, count - like_count, creation_date))
+
+        await copy(connection, "post", POST_COLUMNS, generate_posts(user_ids, posts), args.batch_size)
+        reactions_count = await copy(
+            connection, "reaction", REACTION_COLUMNS, generate_reactions(user_ids, posts, now), args.batch_size
+        )
+
+        for table in ("user", "post", "reaction"):
+            await connection.execute(f'ANALYZE "{table}"')
+    finally:
+        await connection.close()
+
+    if settings.USE_CACHE:
+        # Cached post list pages have shifted.
+        async with redis_client.connected():
+            await invalidate_posts(offset=True)
+
+    hottest = max(counts) if counts else 0
+    print(
+        f"Generated {args.users} users, {args.posts} posts and {reactions_count} reactions "
+        f"(the hottest post has {hottest} reactions)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic dataset for scale testing.")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--reactions", type=int, default=1_000_000, help="Approximate amount of reactions.")
+    parser.add_argument(
+        "--zipf", type=float, default=1.0, help="Skew of reactions per post, 0 - uniform."
+    )
+    parser.add_argument("--like-ratio", type=float, default=0.8, help="Share of likes among reactions.")
+    parser.add_argument(
+        "--days", type=int, default=365, help="Posts and reactions are created during this amount of days."
+    )
+    parser.add_argument("--password", default="password", help="Password of every generated user.")
+    parser.add_argument("--batch-size", type=int, default=COPY_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, help="Random seed for repeatable datasets.")
+    args = parser.parse_args()
+
+    if args.users < 2:
+        parser.error("At least 2 users are needed to have reactions.")
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(generate(args))
+
+
+if __name__ == "__main__":
+    main()
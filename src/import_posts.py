@@ -0,0 +1,157 @@
+"""
+Bulk import of posts from NDJSON or CSV file.
+
+Usage (from src/ folder):
+    python import_posts.py posts.ndjson --owner-id <user id>
+    python import_posts.py posts.csv --owner-id <user id> --batch-size 10000
+
+Every row is validated with `CreatePost` schema (NDJSON - json object per line,
+CSV - header with "title" and "description" columns). Valid posts are loaded
+with COPY in batches, invalid rows are reported and skipped.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+from uuid import UUID, uuid4
+
+import asyncpg
+from pydantic import ValidationError
+
+import settings
+from cache_base import redis_client
+from posts.cache import invalidate_posts
+from posts.models import Post
+from posts.schemas import CreatePost
+
+
+IMPORT_BATCH_SIZE = 5000
+# Amount of reported invalid rows, the rest are only counted.
+MAX_REPORTED_ERRORS = 100
+COLUMNS = ["id", "owner_id", "title", "description"]
+
+
+def read_rows(file: TextIO, file_format: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """
+    Read raw rows from the file one by one.
+
+    :param file: Opened file.
+    :param file_format: "ndjson" or "csv".
+    :returns: An iterator of tuples with line number and row (None if the row can't be parsed).
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            # Empty CSV cell means there is no description.
+            yield reader.line_num, {key: value or None for key, value in row.items() if key}
+        return
+
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def validate_row(row: Optional[Dict[str, Any]]) -> Tuple[Optional[CreatePost], Optional[str]]:
+    """
+    Validate the row with `CreatePost` schema.
+
+    :param row: Parsed row.
+    :returns: A tuple with validated post and error description (one of them is None).
+    """
+    if row is None:
+        return None, "row can't be parsed"
+    try:
+        post = CreatePost.model_validate(row)
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    if len(post.title) > Post.title.type.length:
+        # Too long title fails the whole COPY batch, so it is checked beforehand.
+        return None, f"title: should have at most {Post.title.type.length} characters"
+    return post, None
+
+
+async def import_posts(
+    file: TextIO, file_format: str, owner_id: UUID, batch_size: int
+) -> Tuple[int, int]:
+    """
+    Import posts from the file.
+
+    :param file: Opened file.
+    :param file_format: "ndjson" or "csv".
+    :param owner_id: Id of the user who will own imported posts.
+    :param batch_size: Amount of posts loaded by one COPY.
+    :returns: A tuple with amount of accepted and rejected rows.
+    """
+    connection = await asyncpg.connect(
+        host=settings.DB_HOST,
+        port=int(settings.DB_PORT),
+        user=settings.DB_USER,
+        password=settings.DB_PASS,
+        database=settings.DB_NAME,
+    )
+    accepted = rejected = 0
+    try:
+        if not await connection.fetchval('SELECT EXISTS (SELECT 1 FROM "user" WHERE id = $1)', owner_id):
+            raise SystemExit(f"User {owner_id} does not exist.")
+
+        batch: List[Tuple[UUID, UUID, str, Optional[str]]] = []
+        for line_number, row in read_rows(file, file_format):
+            post, error = validate_row(row)
+            if error is not None:
+                rejected += 1
+                if rejected <= MAX_REPORTED_ERRORS:
+                    print(f"Line {line_number} rejected: {error}", file=sys.stderr)
+                continue
+
+            batch.append((uuid4(), owner_id, post.title, post.description))
+            if len(batch) >= batch_size:
+                await connection.copy_records_to_table("post", records=batch, columns=COLUMNS)
+                accepted += len(batch)
+                batch = []
+                print(f"{accepted} posts imported", file=sys.stderr)
+
+        if batch:
+            await connection.copy_records_to_table("post", records=batch, columns=COLUMNS)
+            accepted += len(batch)
+    finally:
+        await connection.close()
+
+    if settings.USE_CACHE and accepted:
+        # Cached post list pages and the first page of the owner's posts have shifted.
+        async with redis_client.connected():
+            await invalidate_posts(offset=True, owner_id=str(owner_id))
+    return accepted, rejected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import of posts.")
+    parser.add_argument("path", help='Path to NDJSON or CSV file, "-" for stdin.')
+    parser.add_argument("--owner-id", type=UUID, required=True, help="Owner of imported posts.")
+    parser.add_argument(
+        "--format", choices=["ndjson", "csv"], help="File format, detected by extension if omitted."
+    )
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    if args.path == "-":
+        accepted, rejected = asyncio.run(
+            import_posts(sys.stdin, file_format, args.owner_id, args.batch_size)
+        )
+    else:
+        with open(args.path, encoding="utf-8", newline="") as file:
+            accepted, rejected = asyncio.run(
+                import_posts(file, file_format, args.owner_id, args.batch_size)
+            )
+    print(f"Accepted: {accepted}, rejected: {rejected}")
+
+
+if __name__ == "__main__":
+    main()
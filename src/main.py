@@ -1,13 +1,18 @@
+import time
 from logging.config import dictConfig
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 
 import settings
 from auth.base_config import auth_backend, fastapi_users
 from auth.schemas import UserCreate, UserRead
 from cache_base import redis_client
-from posts.router import router
+from database import pool_stats, replica_engines
+from metrics import HISTOGRAMS, RequestStats, observe_request, render_gauges, request_stats, server_timing
+from posts.router import router, users_router
+from posts.write_behind import start_flusher, stop_flusher
 
 
 app = FastAPI(title="Webtronics task")
@@ -23,11 +28,81 @@ app.include_router(
 )
 
 app.include_router(router)
+app.include_router(users_router)
+
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """Send the client to the primary db for a while after it has written something."""
+    response = await call_next(request)
+    if (
+        replica_engines
+        and settings.READ_YOUR_WRITES_WINDOW_SEC
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            settings.READ_YOUR_WRITES_COOKIE,
+            "1",
+            max_age=settings.READ_YOUR_WRITES_WINDOW_SEC,
+            httponly=True,
+        )
+    return response
+
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Measure time the request spends in db and redis."""
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_stats.reset(token)
+    duration = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    # Unmatched paths are not labeled one by one.
+    observe_request(stats, duration, route.path if route else "unmatched", request.method)
+    response.headers["Server-Timing"] = server_timing(stats, duration)
+    return response
 
 
 @app.on_event("startup")
 async def startup_event():
     await redis_client.connect_redis()
+    if settings.USE_CACHE and settings.REACTIONS_WRITE_BEHIND:
+        await start_flusher()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_flusher()
+    await redis_client.disconnect_redis()
+
+
+@app.get("/stats/cache", tags=["stats"])
+async def cache_stats():
+    """Get counters of the in-process cache of this worker."""
+    return {"status": "success", "data": redis_client.local.stats(), "details": None}
+
+
+@app.get("/stats/pool", tags=["stats"])
+async def db_pool_stats():
+    """Get gauges of the db connection pool of this worker."""
+    return {"status": "success", "data": pool_stats(), "details": None}
+
+
+@app.get("/metrics", tags=["stats"], response_class=PlainTextResponse)
+async def metrics():
+    """Get metrics of this worker in Prometheus text format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(render_gauges("l1_cache", "In-process cache counters.", redis_client.local.stats()))
+    lines.extend(render_gauges("db_pool", "DB connection pool gauges.", pool_stats()))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+"""
+Per-request instrumentation of db and redis calls.
+
+Stats of the current request are kept in a context variable, db queries are counted
+by SQLAlchemy engine events and redis round trips by `InstrumentedRedis`.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# Upper bounds of histogram buckets.
+DURATION_BUCKETS_SEC = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Time spent in db and redis by one request."""
+
+    __slots__ = ("db_queries", "db_time", "redis_calls", "redis_time")
+
+    def __init__(self) -> None:
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    """Prometheus histogram with labels."""
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # Bucket counters (the last one is +Inf), sum and count by label values.
+        self._series: Dict[Tuple[Tuple[str, str], ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Add an observation.
+
+        :param value: Observed value.
+        :param labels: Label values of the series.
+        """
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+        total[1] += 1
+
+    def render(self) -> Iterable[str]:
+        """
+        Render the histogram in Prometheus text format.
+
+        :returns: An iterable of lines.
+        """
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, (total, count)) in self._series.items():
+            labels = [f'{name}="{value}"' for name, value in key]
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                bucket_labels = ",".join([*labels, f'le="{bound}"'])
+                yield f"{self.name}_bucket{{{bucket_labels}}} {cumulative}"
+            yield f"{self.name}_sum{{{','.join(labels)}}} {total}"
+            yield f"{self.name}_count{{{','.join(labels)}}} {count}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Total time of the request.", DURATION_BUCKETS_SEC
+)
+db_duration = Histogram(
+    "http_request_db_duration_seconds", "Time spent in db queries by the request.", DURATION_BUCKETS_SEC
+)
+db_queries = Histogram("http_request_db_queries", "Amount of db queries made by the request.", COUNT_BUCKETS)
+redis_duration = Histogram(
+    "http_request_redis_duration_seconds", "Time spent in redis by the request.", DURATION_BUCKETS_SEC
+)
+redis_calls = Histogram(
+    "http_request_redis_calls", "Amount of redis round trips made by the request.", COUNT_BUCKETS
+)
+HISTOGRAMS = (request_duration, db_duration, db_queries, redis_duration, redis_calls)
+
+
+def observe_request(stats: RequestStats, duration: float, route: str, method: str) -> None:
+    """
+    Add stats of the finished request to histograms.
+
+    :param stats: Stats of the request.
+    :param duration: Total time of the request.
+    :param route: Route path template.
+    :param method: HTTP method.
+    """
+    request_duration.observe(duration, route=route, method=method)
+    db_duration.observe(stats.db_time, route=route, method=method)
+    db_queries.observe(stats.db_queries, route=route, method=method)
+    redis_duration.observe(stats.redis_time, route=route, method=method)
+    redis_calls.observe(stats.redis_calls, route=route, method=method)
+
+
+def server_timing(stats: RequestStats, duration: float) -> str:
+    """
+    Build Server-Timing header value.
+
+    :param stats: Stats of the request.
+    :param duration: Total time of the request.
+    :returns: Header value with db, redis and total time in milliseconds.
+    """
+    return (
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_queries} queries", '
+        f'redis;dur={stats.redis_time * 1000:.2f};desc="{stats.redis_calls} calls", '
+        f"total;dur={duration * 1000:.2f}"
+    )
+
+
+def render_gauges(name: str, description: str, values: Dict[str, float]) -> Iterable[str]:
+    """
+    Render gauges in Prometheus text format.
+
+    :param name: Name prefix of the gauges.
+    :param description: Description of the gauges.
+    :param values: A dictionary with gauge name suffix as a key and its value as a value.
+    :returns: An iterable of lines.
+    """
+    for suffix, value in values.items():
+        yield f"# HELP {name}_{suffix} {description}"
+        yield f"# TYPE {name}_{suffix} gauge"
+        yield f"{name}_{suffix} {value}"
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Count queries of the engine and time spent in them.
+
+    :param engine: SQLAlchemy async engine.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_time += time.perf_counter() - context.query_start
+
+
+class InstrumentedPipeline(Pipeline):
+    """Redis pipeline counting its round trips."""
+
+    async def execute(self, raise_on_error: bool = True):
+        stats = request_stats.get()
+        if stats is None:
+            return await super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            stats.redis_calls += 1
+            stats.redis_time += time.perf_counter() - start
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Redis client counting round trips and time spent in them."""
+
+    async def execute_command(self, *args, **options):
+        stats = request_stats.get()
+        if stats is None:
+            return await super().execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            stats.redis_calls += 1
+            stats.redis_time += time.perf_counter() - start
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
@@ -1,24 +1,252 @@
-import pickle
-from typing import Dict, Set
+import json
+import time
+from typing import Dict, List, Optional, Set, Tuple
 
-from cache_base import redis_client
+import settings
+from cache_base import build_key, redis_client, tag_cache
+from posts.models import ReactionType
 
 
+# Tag of post list pages fetched by offset, they shift when posts are added or removed.
+POSTS_OFFSET_TAG = "posts:offset"
+
+# Cached reactions are fresh during this time.
 POST_REACTIONS_CACHE_LIFETIME_SEC = 60
+# With stale-while-revalidate enabled, cached reactions are kept for this time
+# and served stale while they are being refreshed.
+POST_REACTIONS_CACHE_STALE_LIFETIME_SEC = 600
 
+# Atomically checks whether the user has already reacted to the post
+# and if not - stores the reaction and increments its counter.
+# KEYS[1] - hash with reaction counters, KEYS[2] - stream of not yet saved reactions,
+# KEYS[3] - hash of the post reactions which are in the stream (user id -> reaction type),
+# KEYS[4..] - sets of reacted users ids (one per reaction type, in order of ReactionType).
+# ARGV[1] - user id, ARGV[2] - reaction type name, ARGV[3] - index of reaction set in KEYS,
+# ARGV[4] - post id, ARGV[5] - "1" if the reaction should be also put into the stream.
+# Returns -1 if post reactions are not cached, 0 if user has already reacted, 1 otherwise.
+ADD_REACTION_SCRIPT = """
+-- Reactions in the stream are not in db yet, so they are checked even if the post reactions are not cached.
+if redis.call('HEXISTS', KEYS[3], ARGV[1]) == 1 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+for i = 4, #KEYS do
+    if redis.call('SISMEMBER', KEYS[i], ARGV[1]) == 1 then
+        return 0
+    end
+end
+local users_key = KEYS[tonumber(ARGV[3])]
+redis.call('SADD', users_key, ARGV[1])
+redis.call('PEXPIRE', users_key, redis.call('PTTL', KEYS[1]))
+redis.call('HINCRBY', KEYS[1], ARGV[2], 1)
+if ARGV[5] == '1' then
+    redis.call('XADD', KEYS[2], '*', 'post_id', ARGV[4], 'user_id', ARGV[1], 'type', ARGV[2])
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+end
+return 1
+"""
 
-async def update_cache_reactions(
-    reactions: Dict[str, Set[str]], cache_key: str
-) -> None:
+# Merges reactions loaded from db into the cached ones. Reactions are never removed,
+# so cached reactions missing in db are the ones added meanwhile and must be kept.
+# Reactions which are still in the stream are added too.
+# KEYS[1] - hash with reaction counters, KEYS[2] - hash of the post reactions which are in the stream,
+# KEYS[3..] - sets of reacted users ids (in order of ReactionType).
+# ARGV[1] - lifetime, ARGV[2] - time until which reactions are fresh,
+# then a pair of reaction type name and json list of reacted users ids for every set.
+MERGE_REACTIONS_SCRIPT = """
+local users_keys = {}
+for i = 3, #KEYS do
+    users_keys[ARGV[2 * i - 3]] = KEYS[i]
+    local users = cjson.decode(ARGV[2 * i - 2])
+    for j = 1, #users, 1000 do
+        redis.call('SADD', KEYS[i], unpack(users, j, math.min(j + 999, #users)))
+    end
+end
+local pending = redis.call('HGETALL', KEYS[2])
+for i = 1, #pending, 2 do
+    redis.call('SADD', users_keys[pending[i + 1]], pending[i])
+end
+-- Counters hash is written even for post without reactions,
+-- its existence means that reactions of the post are cached.
+redis.call('HSET', KEYS[1], 'fresh_until', ARGV[2])
+for name, users_key in pairs(users_keys) do
+    redis.call('HSET', KEYS[1], name, redis.call('SCARD', users_key))
+    redis.call('EXPIRE', users_key, ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 0
+"""
+
+_add_reaction_script = None
+_merge_reactions_script = None
+
+
+def reaction_keys(post_id: str) -> Tuple[str, List[str]]:
+    """
+    Build keys of cached post reactions.
+
+    :param post_id: Post id in db.
+    :returns: A tuple with key of reaction counters hash and
+    list of keys of reacted users sets (in order of ReactionType).
+    """
+    counts_key = build_key("reactions", post_id, "counts")
+    users_keys = [build_key("reactions", post_id, react.name) for react in ReactionType]
+    return counts_key, users_keys
+
+
+def pending_key(post_id: str) -> str:
+    """
+    Build key of the hash with reactions of the post which are accepted but not saved to db yet.
+
+    :param post_id: Post id in db.
+    :returns: Key of the hash (user id as a field and reaction type name as a value).
+    """
+    return build_key("reactions", post_id, "pending")
+
+
+async def update_cache_reactions(reactions: Dict[str, Set[str]], post_id: str) -> None:
     """
-    Add to cache reactions by given key.
+    Add to cache reactions of the given post.
+
+    Loaded reactions are merged into the cached ones, so reactions added to the cache
+    while these were loaded are kept. Reactions which are accepted but not saved to db
+    yet are added too.
 
     :param reactions: A dictionary with reaction type as a key and
     set of reacted users id's as a value.
+    :param post_id: Post id in db.
+    """
+    global _merge_reactions_script
+    if _merge_reactions_script is None:
+        _merge_reactions_script = redis_client.redis.register_script(MERGE_REACTIONS_SCRIPT)
+
+    counts_key, users_keys = reaction_keys(post_id)
+    lifetime = (
+        POST_REACTIONS_CACHE_STALE_LIFETIME_SEC
+        if settings.REACTIONS_CACHE_STALE_WHILE_REVALIDATE
+        else POST_REACTIONS_CACHE_LIFETIME_SEC
+    )
+    args = [lifetime, int(time.time()) + POST_REACTIONS_CACHE_LIFETIME_SEC]
+    for react in ReactionType:
+        args.extend((react.name, json.dumps(list(reactions[react.name]))))
+    await _merge_reactions_script(keys=[counts_key, pending_key(post_id), *users_keys], args=args)
+
+
+async def delete_cache_reactions(post_id: str) -> None:
+    """
+    Delete cached reactions of the given post.
+
+    :param post_id: Post id in db.
+    """
+    counts_key, users_keys = reaction_keys(post_id)
+    await redis_client.redis.delete(counts_key, *users_keys)
+
+
+async def get_cache_reactions(post_id: str) -> Optional[Tuple[Dict[str, Set[str]], bool]]:
+    """
+    Get cached reactions of the given post.
+
+    :param post_id: Post id in db.
+    :returns: None if reactions are not cached, otherwise a tuple with
+    a dictionary (reaction type as a key and set of reacted users id's as a value)
+    and flag showing whether cached reactions are stale and should be refreshed.
+    """
+    counts_key, users_keys = reaction_keys(post_id)
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.hget(counts_key, "fresh_until")
+        for users_key in users_keys:
+            pipe.smembers(users_key)
+        fresh_until, *users = await pipe.execute()
+
+    if fresh_until is None:
+        return None
+    reactions = {
+        react.name: {user_id.decode() for user_id in reacted_users}
+        for react, reacted_users in zip(ReactionType, users)
+    }
+    return reactions, int(fresh_until) < time.time()
+
+
+async def add_cache_reaction(
+    post_id: str, user_id: str, reaction: ReactionType, enqueue: bool = False
+) -> int:
+    """
+    Add reaction to the cached reactions of the post in one round trip.
+
+    :param post_id: Post id in db.
+    :param user_id: User id in db.
+    :param reaction: User's reaction on the post.
+    :param enqueue: Also put the reaction into the stream of not yet saved reactions.
+    :returns: -1 if reactions of the post are not cached,
+    0 if the user has already reacted to the post, 1 if the reaction was added.
+    """
+    return await _add_reaction_script_call(post_id, user_id, reaction, enqueue)
+
+
+async def add_cache_reactions(reactions: List[Tuple[str, str, ReactionType]]) -> None:
+    """
+    Add several saved reactions to the cached reactions of the posts in one round trip.
+
+    :param reactions: A list of tuples with post id, user id and reaction type.
+    """
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        for post_id, user_id, reaction in reactions:
+            await _add_reaction_script_call(post_id, user_id, reaction, client=pipe)
+        await pipe.execute()
+
+
+async def _add_reaction_script_call(
+    post_id: str, user_id: str, reaction: ReactionType, enqueue: bool = False, client=None
+):
+    global _add_reaction_script
+    if _add_reaction_script is None:
+        # Script is sent by its sha, the source is sent only if redis doesn't know it yet.
+        _add_reaction_script = redis_client.redis.register_script(ADD_REACTION_SCRIPT)
+
+    counts_key, users_keys = reaction_keys(post_id)
+    users_key_index = list(ReactionType).index(reaction) + 4
+    return await _add_reaction_script(
+        keys=[counts_key, settings.REACTIONS_STREAM, pending_key(post_id), *users_keys],
+        args=[user_id, reaction.name, users_key_index, post_id, int(enqueue)],
+        client=client,
+    )
+
+
+def post_tag(post_id: str) -> str:
+    """
+    Build cache tag of the post, cached responses showing the post are tagged with it.
+
+    :param post_id: Post id in db.
+    :returns: Tag of the post.
+    """
+    return build_key("post", str(post_id))
+
+
+def author_tag(owner_id: str) -> str:
+    """
+    Build cache tag of the author, cached first page of the author's posts is tagged with it.
+
+    :param owner_id: User id in db.
+    :returns: Tag of the author.
+    """
+    return build_key("author", str(owner_id))
+
+
+async def invalidate_posts(
+    *post_ids: str, offset: bool = False, owner_id: Optional[str] = None
+) -> None:
+    """
+    Drop cached responses showing the posts.
+
+    :param post_ids: Ids of changed posts.
+    :param offset: Also drop post list pages fetched by offset (posts were added or removed).
+    :param owner_id: Also drop the first page of posts of this author (the author's posts have changed).
     """
-    if any(reactions.values()):
-        await redis_client.redis.set(
-            cache_key,
-            pickle.dumps(reactions),
-            ex=POST_REACTIONS_CACHE_LIFETIME_SEC,
-        )
+    tags = [post_tag(post_id) for post_id in post_ids]
+    if offset:
+        tags.append(POSTS_OFFSET_TAG)
+    if owner_id is not None:
+        tags.append(author_tag(owner_id))
+    await tag_cache.invalidate(*tags)
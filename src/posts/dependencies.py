@@ -1,12 +1,15 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
 from uuid import UUID
 
-from fastapi import Depends
+from fastapi import Depends, Header
 from auth.models import User
 from database import get_async_session
 from auth.base_config import current_user
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from posts.exceptions import invalid_post_id
+from posts.exceptions import invalid_cursor, invalid_post_id, invalid_user_id
+from posts.utils import decode_cursor, decode_search_cursor
 
 
 def validate_id(post_id: str) -> UUID:
@@ -24,6 +27,65 @@ def validate_id(post_id: str) -> UUID:
     return post_id
 
 
+def validate_user_id(user_id: str) -> str:
+    """
+    Validate user id.
+
+    :param user_id: User id in db.
+    :raises HTTPException: User id cannot be converted to UUID.
+    """
+    try:
+        UUID(user_id)
+    except ValueError:
+        raise invalid_user_id()
+    return user_id
+
+
+def validate_cursor(cursor: Optional[str] = None) -> Optional[Tuple[datetime, UUID]]:
+    """
+    Validate pagination cursor.
+
+    :param cursor: Opaque cursor returned with the previous page.
+    :raises HTTPException: Cursor cannot be decoded.
+    :returns: A tuple with creation date and id of the last seen post or None.
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except (ValueError, TypeError, AttributeError):
+        raise invalid_cursor()
+
+
+def validate_search_cursor(cursor: Optional[str] = None) -> Optional[Tuple[float, UUID]]:
+    """
+    Validate search pagination cursor.
+
+    :param cursor: Opaque cursor returned with the previous page of search results.
+    :raises HTTPException: Cursor cannot be decoded.
+    :returns: A tuple with search rank and id of the last seen post or None.
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_search_cursor(cursor)
+    except (ValueError, TypeError, AttributeError):
+        raise invalid_cursor()
+
+
+def if_none_match(if_none_match: Optional[str] = Header(None)) -> List[str]:
+    """
+    Parse If-None-Match header.
+
+    :param if_none_match: Header value, a comma separated list of ETags.
+    :returns: A list of ETags (weak ones are compared as strong ones).
+    """
+    if not if_none_match:
+        return []
+    etags = [etag.strip() for etag in if_none_match.split(",")]
+    return [etag[2:] if etag.startswith("W/") else etag for etag in etags]
+
+
 async def reaction_common_params(
     session: AsyncSession = Depends(get_async_session),
     user: User = Depends(current_user),
@@ -38,6 +38,18 @@ def invalid_post_id() -> HTTPException:
     )
 
 
+def invalid_user_id() -> HTTPException:
+    """
+    Occur when user id cannot be converted to UUID.
+
+    :returns: HTTPException with filled attributes.
+    """
+
+    return HTTPException(
+        400, {"status": "error", "data": None, "details": "Bad user id."}
+    )
+
+
 def user_not_owner() -> HTTPException:
     """
     Occur when user is not owner of post.
@@ -107,3 +119,15 @@ def reaction_on_reacted_post() -> HTTPException:
         },
         None,
     )
+
+
+def invalid_cursor() -> HTTPException:
+    """
+    Occur when pagination cursor cannot be decoded.
+
+    :returns: HTTPException with filled attributes.
+    """
+
+    return HTTPException(
+        400, {"status": "error", "data": None, "details": "Bad cursor."}
+    )
@@ -3,14 +3,18 @@ import enum
 from datetime import datetime
 from typing import List, Set
 
-from sqlalchemy import TIMESTAMP, Enum, ForeignKey, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import TIMESTAMP, Computed, Enum, ForeignKey, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
 from database import Base
 
 
+# Text search configuration of the posts search vector.
+SEARCH_CONFIG = "english"
+
+
 class ReactionType(enum.Enum):
     dislike = 0
     like = 1
@@ -22,10 +26,24 @@ class Reaction(Base):
     user_id: Mapped[UUID] = mapped_column(ForeignKey("user.id"), primary_key=True)
     post_id: Mapped[UUID] = mapped_column(ForeignKey("post.id", ondelete="cascade"), primary_key=True)
     type: Mapped[Enum[ReactionType]] = mapped_column(Enum(ReactionType))
+    # Used to rebuild time-decayed trending scores.
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, server_default=func.now())
 
 
 class Post(Base):
     __tablename__ = "post"
+    __table_args__ = (
+        # Supports keyset pagination over (creation_date, id).
+        Index("ix_post_creation_date_id", "creation_date", "id"),
+        # Supports posts of one author, newest first.
+        Index(
+            "ix_post_owner_id_creation_date_id",
+            "owner_id",
+            text("creation_date DESC"),
+            text("id DESC"),
+        ),
+        Index("ix_post_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[UUID] = mapped_column(UUID, primary_key=True, default=uuid4)
     owner_id: Mapped[UUID] = mapped_column(ForeignKey("user.id"))
@@ -38,4 +56,19 @@ class Post(Base):
     last_update_date: Mapped[datetime] = mapped_column(
         TIMESTAMP, server_default=func.now(), onupdate=func.now()
     )
+    # Denormalized reaction counters, kept in sync by `service.new_reaction`.
+    like_count: Mapped[int] = mapped_column(Integer, server_default="0", default=0)
+    dislike_count: Mapped[int] = mapped_column(Integer, server_default="0", default=0)
+    # Maintained by db from the title (higher weight) and the description.
+    # Deferred: it is needed only inside queries, not in loaded posts.
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+        nullable=True,
+        deferred=True,
+    )
     user_reactions: Mapped[Set["Reaction"]] = relationship()
@@ -1,33 +1,99 @@
-from typing import Any, Dict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
-from auth.base_config import current_user
+from auth.base_config import current_superuser, current_user
 from auth.models import User
-from database import get_async_session
+from cache_base import tag_cache
+from database import get_async_session, get_read_session, is_primary
 from posts import service
-from posts.cache import update_cache_reactions
-from posts.dependencies import reaction_common_params, validate_id
-from posts.exceptions import (
-    reaction_on_reacted_post,
-    reaction_on_yourself,
-    user_not_owner,
+from posts.cache import POSTS_OFFSET_TAG, author_tag, post_tag
+from posts.dependencies import (
+    if_none_match,
+    reaction_common_params,
+    validate_cursor,
+    validate_id,
+    validate_search_cursor,
+    validate_user_id,
 )
+from posts.exceptions import user_not_owner
 from posts.models import ReactionType
-from posts.schemas import CreatePost, EditPost
-from cache_base import build_key
+from posts.schemas import (
+    BatchReactions,
+    CreatePost,
+    EditPost,
+    MAX_TOP_POSTS_COUNT,
+    PostDetail,
+    PostResponse,
+    PostsPage,
+    SearchPage,
+    TopPostsResponse,
+)
+from posts.trending import TrendingWindow
+from posts.utils import ModelResponse, content_etag, encode_cursor
 
 
 router = APIRouter(prefix="/posts", tags=["posts"])
+users_router = APIRouter(prefix="/users", tags=["posts"])
 
 
-@router.get("")
-async def get_posts(session: AsyncSession = Depends(get_async_session), skip: int = 0):
-    """Get post list."""
-    posts = await service.get_posts(skip, session)
-    return {"status": "success", "data": posts, "details": None}
+@router.get("", response_model=PostsPage, response_class=ModelResponse)
+async def get_posts(
+    session: AsyncSession = Depends(get_read_session),
+    skip: int = 0,
+    cursor: Optional[Tuple[datetime, UUID]] = Depends(validate_cursor),
+    etags: List[str] = Depends(if_none_match),
+):
+    """
+    Get post list.
+
+    Pass `next_cursor` from the previous response as `cursor` to get the next page.
+    `skip` is kept for compatibility and is ignored when `cursor` is given.
+    Responds with 304 if the page has not changed since the ETag passed in If-None-Match.
+    """
+
+    async def load(session: AsyncSession) -> Tuple[BaseModel, List[str]]:
+        posts, next_cursor = await service.get_posts(session, skip, cursor)
+        return PostsPage(data=posts, next_cursor=next_cursor), [post_tag(post.id) for post in posts]
+
+    if cursor is not None:
+        # Posts are only added to the head of the list, so pages fetched by cursor
+        # change only with the posts on them.
+        return await cached_response(f"posts:{encode_cursor(*cursor)}", [], load, session, etags)
+    return await cached_response(f"posts:skip{skip}", [POSTS_OFFSET_TAG], load, session, etags)
+
+
+@users_router.get("/{user_id}/posts", response_model=PostsPage, response_class=ModelResponse)
+async def get_user_posts(
+    session: AsyncSession = Depends(get_read_session),
+    user_id: str = Depends(validate_user_id),
+    cursor: Optional[Tuple[datetime, UUID]] = Depends(validate_cursor),
+    etags: List[str] = Depends(if_none_match),
+):
+    """
+    Get posts of the user, newest first.
+
+    Pass `next_cursor` from the previous response as `cursor` to get the next page.
+    Responds with 304 if the page has not changed since the ETag passed in If-None-Match.
+    """
+
+    async def load(session: AsyncSession) -> Tuple[BaseModel, List[str]]:
+        posts, next_cursor = await service.get_posts(session, cursor=cursor, owner_id=user_id)
+        return PostsPage(data=posts, next_cursor=next_cursor), [post_tag(post.id) for post in posts]
+
+    if cursor is not None:
+        content, _ = await load(session)
+        return ModelResponse(content)
+    # Profile pages mostly show the first page, only it is cached.
+    return await cached_response(
+        f"posts:author:{user_id}", [author_tag(user_id)], load, session, etags
+    )
 
 
 @router.post("")
@@ -45,24 +111,91 @@ async def create_post(
     }
 
 
-@router.get("/{post_id}")
-async def get_post(
+@router.get("/export")
+async def export_posts(user: User = Depends(current_superuser)):
+    """
+    Export all posts with reaction counts as NDJSON (one post per line).
+
+    Available only for superusers.
+    """
+    return StreamingResponse(service.export_posts(), media_type="application/x-ndjson")
+
+
+@router.get("/search", response_model=SearchPage, response_class=ModelResponse)
+async def search_posts(
+    q: str = Query(min_length=1, max_length=200),
+    session: AsyncSession = Depends(get_read_session),
+    cursor: Optional[Tuple[float, UUID]] = Depends(validate_search_cursor),
+):
+    """
+    Full-text search over titles and descriptions of posts, best matches first.
+
+    `q` supports web search syntax: "quoted phrase", `or`, `-excluded`.
+    Pass `next_cursor` from the previous response as `cursor` to get the next page.
+    """
+    posts, next_cursor = await service.search_posts(q, session, cursor)
+    return SearchPage(data=posts, next_cursor=next_cursor)
+
+
+@router.get("/top", response_model=TopPostsResponse, response_class=ModelResponse)
+async def get_top_posts(
+    window: TrendingWindow = TrendingWindow.day,
+    limit: int = Query(10, ge=1, le=MAX_TOP_POSTS_COUNT),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Get trending posts, the highest score first.
+
+    Likes add to the score and dislikes take away from it. In the `hour` and `day` windows
+    reactions lose half of their weight every hour/day, `all` counts all reactions equally.
+    """
+    posts = await service.get_top_posts(window, limit, session)
+    return TopPostsResponse(data=posts)
+
+
+@router.post("/reactions:batch")
+async def react_on_posts(
+    batch: BatchReactions,
     session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user),
+):
+    """
+    Add reactions to several posts at once.
+
+    Each reaction gets its own status: "success", "not_found", "own_post" or "already_reacted".
+    """
+    reactions = [(str(item.post_id), ReactionType[item.type]) for item in batch.reactions]
+    statuses = await service.new_reactions(reactions, str(user.id), session)
+    return {
+        "status": "success",
+        "data": [
+            {"post_id": item.post_id, "type": item.type, "status": status}
+            for item, status in zip(batch.reactions, statuses)
+        ],
+        "details": None,
+    }
+
+
+@router.get("/{post_id}", response_model=PostResponse, response_class=ModelResponse)
+async def get_post(
+    session: AsyncSession = Depends(get_read_session),
     post_id: str = Depends(validate_id),
+    etags: List[str] = Depends(if_none_match),
 ):
-    """Get specific post."""
-    post = await service.get_post(post_id, session)
+    """
+    Get specific post.
 
-    post_dict = post._asdict()
-    post_dict["reactions"] = await service.get_reactions(post, session)
+    Responds with 304 if the post has not changed since the ETag passed in If-None-Match.
+    """
 
-    if settings.USE_CACHE:
-        # Refresh cache.
-        await update_cache_reactions(
-            post_dict["reactions"], cache_key=build_key("reactions", str(post.id))
-        )
+    async def load(session: AsyncSession) -> Tuple[BaseModel, List[str]]:
+        post_data = await service.get_post_data(post_id, session)
+        reactions = await service.get_reactions(post_id, session)
+        # Post and reactions are already validated.
+        post = PostDetail.model_construct(**dict(post_data), reactions=reactions)
+        return PostResponse(data=post), []
 
-    return {"status": "success", "data": post_dict, "details": None}
+    return await cached_response(f"post:{post_id}", [post_tag(post_id)], load, session, etags)
 
 
 @router.patch("/{post_id}")
@@ -128,33 +261,65 @@ async def react_on_post(
     :param post_id: Post id in db.
     :param reaction: User's reaction on the post.
     """
-    user_id = str(user.id)
-    post = await service.get_post(post_id, session)
-
-    if post.owner_id == user_id:
-        raise reaction_on_yourself()
-
-    reactions = await service.get_reactions(post, session)
-    if settings.USE_CACHE:
-        # Refresh cache.
-        await update_cache_reactions(
-            reactions, cache_key=build_key("reactions", str(post.id))
-        )
-    # Checking whether the user reacted to this post.
-    for reacted_users in reactions.values():
-        if user_id in reacted_users:
-            raise reaction_on_reacted_post()
-
-    await service.new_reaction(str(post.id), user_id, session, reaction, reactions)
-
-    if settings.USE_CACHE:
-        # Modify cache.
-        await update_cache_reactions(
-            reactions, cache_key=build_key("reactions", post_id)
-        )
+    await service.new_reaction(post_id, str(user.id), session, reaction)
 
     return {
         "status": "success",
         "data": None,
         "details": f"Successfully '{reaction.name}' post!",
     }
+
+
+async def cached_response(
+    key: str,
+    tags: List[str],
+    load: Callable[[AsyncSession], Awaitable[Tuple[BaseModel, List[str]]]],
+    session: AsyncSession,
+    etags: List[str],
+) -> Response:
+    """
+    Get response from the tag cache or load it and put into the cache.
+
+    Responses are loaded with the session of the request. A lagging replica could give a body
+    older than the tag versions it is stored with, so responses loaded from a replica are cached
+    for REPLICA_RESPONSE_CACHE_LIFETIME_SEC only.
+
+    :param key: Key of the response.
+    :param tags: Tags of the response known before loading.
+    :param load: Loads the response with the given session, returns it with tags found in it.
+    :param session: SQLAlchemy session of the request.
+    :param etags: ETags passed in If-None-Match.
+    :returns: Response with ETag, 304 if the client already has it.
+    """
+    if not settings.USE_CACHE:
+        content, _ = await load(session)
+        return ModelResponse(content)
+
+    cached = await tag_cache.get(key, etags)
+    if cached is not None:
+        etag, body = cached
+        if body is None:
+            return not_modified(etag)
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    # Versions are read before loading, so changes made meanwhile keep the stale response out of cache.
+    snapshot = await tag_cache.snapshot(*tags)
+    content, content_tags = await load(session)
+    response = ModelResponse(content)
+    etag = content_etag(response.body)
+    lifetime = None if is_primary(session) else settings.REPLICA_RESPONSE_CACHE_LIFETIME_SEC
+    await tag_cache.set(key, etag, response.body, [*tags, *content_tags], snapshot, lifetime)
+    if etag in etags or "*" in etags:
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Build response for conditional request of not changed content.
+
+    :param etag: ETag of the content.
+    :returns: Response with 304 status.
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -1,6 +1,16 @@
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, Generic, List, Optional, Set, TypeVar
+from uuid import UUID
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, ConfigDict, Field, computed_field, field_serializer, validator
+
+from posts.models import ReactionType
+
+
+MAX_BATCH_REACTIONS_COUNT = 100
+MAX_TOP_POSTS_COUNT = 100
+
+DataT = TypeVar("DataT")
 
 
 class CreatePost(BaseModel):
@@ -18,3 +28,81 @@ class EditPost(BaseModel):
         if value:
             value = tmp if (tmp := value.strip()) else None
         return value
+
+
+class BatchReaction(BaseModel):
+    post_id: UUID
+    type: str
+
+    @validator("type")
+    def validate_type(cls, value):
+        if value not in ReactionType.__members__:
+            raise ValueError(f"Reaction type should be one of: {', '.join(ReactionType.__members__)}")
+        return value
+
+
+class BatchReactions(BaseModel):
+    reactions: List[BatchReaction] = Field(max_length=MAX_BATCH_REACTIONS_COUNT)
+
+
+class Envelope(BaseModel, Generic[DataT]):
+    status: str = "success"
+    data: DataT
+    details: Optional[Any] = None
+
+
+class PostRead(BaseModel):
+    # Read straight from Post attributes, without converting the row to a dict.
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    owner_id: UUID
+    title: str
+    description: Optional[str]
+    creation_date: datetime
+    last_update_date: datetime
+    like_count: int
+    dislike_count: int
+
+
+class PostListItem(PostRead):
+    @computed_field
+    @property
+    def reactions(self) -> Dict[str, int]:
+        """Amount of each reaction type under the post."""
+        return {react.name: getattr(self, f"{react.name}_count") for react in ReactionType}
+
+
+class PostDetail(PostRead):
+    reactions: Dict[str, Set[str]]
+
+    # Set order differs between workers (hash seed), sorted lists keep the body and its ETag stable.
+    @field_serializer("reactions")
+    def serialize_reactions(self, reactions: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+        return {
+            react.name: sorted(reactions[react.name]) for react in ReactionType if react.name in reactions
+        }
+
+
+class PostSearchItem(PostListItem):
+    rank: float
+    # Matched words are wrapped in <b></b>.
+    title_highlight: str
+    description_highlight: Optional[str]
+
+
+class TopPost(PostListItem):
+    # Trending score at the moment of the request.
+    score: float
+
+
+PostResponse = Envelope[PostDetail]
+TopPostsResponse = Envelope[List[TopPost]]
+
+
+class PostsPage(Envelope[List[PostListItem]]):
+    next_cursor: Optional[str] = None
+
+
+class SearchPage(Envelope[List[PostSearchItem]]):
+    next_cursor: Optional[str] = None
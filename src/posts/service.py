@@ -1,21 +1,56 @@
-import pickle
-from typing import Any, Dict, List, Set
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncGenerator, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import InstrumentedAttribute
 
 import settings
-from cache_base import build_key, redis_client
-from posts.exceptions import empty_post_update_data, post_not_found
-from posts.models import Post, Reaction, ReactionType
+from cache_base import build_key, single_flight
+from database import async_session_maker, get_read_session_maker, is_primary
+from posts import trending
+from posts.cache import (
+    add_cache_reaction,
+    add_cache_reactions,
+    delete_cache_reactions,
+    get_cache_reactions,
+    invalidate_posts,
+    update_cache_reactions,
+)
+from posts.exceptions import (
+    empty_post_update_data,
+    post_not_found,
+    reaction_on_reacted_post,
+    reaction_on_yourself,
+)
+from posts.models import SEARCH_CONFIG, Post, Reaction, ReactionType
+from posts.schemas import PostListItem, PostRead, PostSearchItem, TopPost
+from posts.utils import (
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
+    encode_cursor,
+    encode_search_cursor,
+    highlight_to_html,
+    json_default,
+)
 import logging
 
 
 MAX_POSTS_COUNT_PER_PAGE = 10
+EXPORT_CHUNK_SIZE = 1000
+SEARCH_HIGHLIGHT_OPTIONS = (
+    f"MaxFragments=2, MaxWords=20, MinWords=5, StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}"
+)
 logger = logging.getLogger("uvicorn")
 
+# Background refreshes of stale cached reactions by post id.
+_refreshing: Dict[str, asyncio.Task] = {}
+
 
 async def create_post(post_data: dict, user_id: str, session: AsyncSession) -> Post:
     """
@@ -35,6 +70,9 @@ async def create_post(post_data: dict, user_id: str, session: AsyncSession) -> P
     await session.commit()
     post = post.first()
     logger.info(f"Post {post.id} created")
+
+    if settings.USE_CACHE:
+        await invalidate_posts(offset=True, owner_id=user_id)
     return post
 
 
@@ -55,6 +93,18 @@ async def get_post(post_id: str, session: AsyncSession) -> Post:
     return post
 
 
+async def get_post_data(post_id: str, session: AsyncSession) -> PostRead:
+    """
+    Get a specifiс Post presented in the form of pydantic model.
+
+    :param post_id: Post id in db.
+    :param session: SQLAlchemy session for querying.
+    :raises HTTPException: The post does not exist.
+    :returns: A PostRead object.
+    """
+    return PostRead.model_validate(await get_post(post_id, session))
+
+
 async def update_post(post_id: str, new_post_data: dict, session: AsyncSession) -> None:
     """
     Updates post.
@@ -67,18 +117,25 @@ async def update_post(post_id: str, new_post_data: dict, session: AsyncSession)
     # Checking if user given data is empty
     if not new_post_data:
         raise empty_post_update_data()
-    stmt = sa.update(Post).where(Post.id == post_id).values(**new_post_data)
-    await session.execute(stmt)
+    stmt = (
+        sa.update(Post)
+        .where(Post.id == post_id)
+        .values(**new_post_data)
+        .returning(Post.owner_id)
+    )
+    owner_id = (await session.execute(stmt)).scalar()
     await session.commit()
     logger.info(f"Post {post_id} updated")
 
+    if settings.USE_CACHE:
+        await invalidate_posts(post_id, owner_id=owner_id)
+
 
 async def new_reaction(
     post_id: str,
     user_id: str,
     session: AsyncSession,
     reaction: ReactionType,
-    reactions: Dict[str, Set[str]],
 ) -> None:
     """
     Add new reaction to the post.
@@ -87,17 +144,286 @@ async def new_reaction(
     :param user_id: User id in db.
     :param session: SQLAlchemy session for querying.
     :param reaction: User's reaction on the post.
-    :param reactions: A dictionary with reaction type as a key and
-    set of reacted users id's as a value.
+    :raises HTTPException: The post does not exist, the user is the owner of the post
+    or the user has already reacted to the post.
+    """
+    if settings.USE_CACHE and settings.REACTIONS_WRITE_BEHIND:
+        await enqueue_reaction(post_id, user_id, session, reaction)
+    else:
+        await save_reaction(post_id, user_id, session, reaction)
+
+
+async def enqueue_reaction(
+    post_id: str,
+    user_id: str,
+    session: AsyncSession,
+    reaction: ReactionType,
+) -> None:
+    """
+    Accept new reaction into the redis stream, it is saved to db later by the flusher.
+
+    Previous reactions of the user are checked by redis in the same call
+    that puts the reaction into the stream.
+
+    :param post_id: Post id in db.
+    :param user_id: User id in db.
+    :param session: SQLAlchemy session for querying.
+    :param reaction: User's reaction on the post.
+    :raises HTTPException: The post does not exist, the user is the owner of the post
+    or the user has already reacted to the post.
+    """
+    post_data = await get_post_data(post_id, session)
+    if str(post_data.owner_id) == str(user_id):
+        raise reaction_on_yourself()
+
+    added = await add_cache_reaction(post_id, user_id, reaction, enqueue=True)
+    if added == -1:
+        # Reactions are not cached: load them from db and try again.
+        await single_flight.do(
+            build_key("reactions", post_id),
+            lambda: load_reactions(post_id, session),
+            lambda: read_cache_reactions(post_id),
+        )
+        added = await add_cache_reaction(post_id, user_id, reaction, enqueue=True)
+    if added == -1:
+        # Cache has expired again, there is nothing to check against: save the reaction right away.
+        await save_reaction(post_id, user_id, session, reaction)
+        return
+    if added == 0:
+        raise reaction_on_reacted_post()
+
+    logger.info(f"{reaction.name.capitalize()} on Post {post_id} accepted")
+    await invalidate_posts(post_id)
+
+
+async def save_reaction(
+    post_id: str,
+    user_id: str,
+    session: AsyncSession,
+    reaction: ReactionType,
+) -> None:
+    """
+    Save new reaction of the post to db.
+
+    Existence of the post, its owner and previous reactions of the user
+    are checked by the same statement that inserts the reaction and updates the counter.
+
+    :param post_id: Post id in db.
+    :param user_id: User id in db.
+    :param session: SQLAlchemy session for querying.
+    :param reaction: User's reaction on the post.
+    :raises HTTPException: The post does not exist, the user is the owner of the post
+    or the user has already reacted to the post.
     """
-    # reactions = await get_reactions(post, session)
+    target = sa.select(Post.id, Post.owner_id).where(Post.id == post_id).cte("target")
+    inserted = (
+        postgresql.insert(Reaction)
+        .from_select(
+            ["user_id", "post_id", "type"],
+            sa.select(
+                sa.literal(user_id, Reaction.user_id.type),
+                target.c.id,
+                sa.cast(sa.literal(reaction, Reaction.type.type), Reaction.type.type),
+            ).where(target.c.owner_id != user_id),
+        )
+        # Primary key (user_id, post_id) doesn't allow reacting twice.
+        .on_conflict_do_nothing()
+        .returning(Reaction.post_id)
+        .cte("inserted")
+    )
+    counter = reaction_counter(reaction)
+    counted = (
+        sa.update(Post)
+        .where(Post.id == sa.select(inserted.c.post_id).scalar_subquery())
+        # Reactions are not an edit of the post, so keep last_update_date as is.
+        .values({counter: counter + 1, Post.last_update_date: Post.last_update_date})
+        .returning(Post.id, *(reaction_counter(react) for react in ReactionType))
+        .cte("counted")
+    )
+    stmt = sa.select(
+        sa.select(target.c.owner_id).scalar_subquery().label("owner_id"),
+        sa.select(counted.c.id).exists().label("reacted"),
+        # Counters after the reaction (None if it wasn't saved).
+        *(
+            sa.select(counted.c[reaction_counter(react).key]).scalar_subquery().label(react.name)
+            for react in ReactionType
+        ),
+    )
+    result = (await session.execute(stmt)).one()
 
-    reactions[reaction.name].add(user_id)
+    if result.owner_id is None:
+        raise post_not_found()
+    if str(result.owner_id) == str(user_id):
+        raise reaction_on_yourself()
+    if not result.reacted:
+        raise reaction_on_reacted_post()
 
-    stmt = sa.insert(Reaction).values(user_id=user_id, post_id=post_id, type=reaction)
-    await session.execute(stmt)
     await session.commit()
     logger.info(f"{reaction.name.capitalize()} on Post {post_id}")
+    await trending.add_reaction_scores(
+        [(post_id, reaction)], {str(post_id): {react.name: result[react.name] for react in ReactionType}}
+    )
+
+    if settings.USE_CACHE:
+        # Mirror the reaction into the cache (does nothing if the post reactions are not cached).
+        await add_cache_reaction(post_id, user_id, reaction)
+        await invalidate_posts(post_id)
+
+
+async def new_reactions(
+    reactions: List[Tuple[str, ReactionType]], user_id: str, session: AsyncSession
+) -> List[str]:
+    """
+    Add several reactions of the user at once.
+
+    Posts and previous reactions are checked by set-based queries and
+    all valid reactions are inserted by one statement.
+
+    :param reactions: A list of tuples with post id and user's reaction on the post.
+    :param user_id: User id in db.
+    :param session: SQLAlchemy session for querying.
+    :returns: A list with status of each reaction: "success", "not_found",
+    "own_post" or "already_reacted".
+    """
+    owners = await get_post_owners({post_id for post_id, _ in reactions}, session)
+
+    statuses = []
+    valid = {}
+    for post_id, reaction in reactions:
+        if post_id not in owners:
+            statuses.append("not_found")
+        elif owners[post_id] == str(user_id):
+            statuses.append("own_post")
+        elif post_id in valid:
+            # The same post is given twice.
+            statuses.append("already_reacted")
+        else:
+            valid[post_id] = reaction
+            statuses.append(None)
+
+    inserted = await insert_reactions(
+        [(post_id, user_id, reaction) for post_id, reaction in valid.items()], session, owners
+    )
+    logger.info(f"{len(inserted)} reactions of User {user_id} added")
+
+    if settings.USE_CACHE and inserted:
+        # Mirror the reactions into the cache.
+        await add_cache_reactions(
+            [(post_id, user_id, valid[post_id]) for post_id, _ in inserted]
+        )
+        await invalidate_posts(*(post_id for post_id, _ in inserted))
+
+    reacted = {post_id for post_id, _ in inserted}
+    result = []
+    for (post_id, _), status in zip(reactions, statuses):
+        if status is None:
+            status = "success" if post_id in reacted else "already_reacted"
+        result.append(status)
+    return result
+
+
+async def get_post_owners(post_ids: Set[str], session: AsyncSession) -> Dict[str, str]:
+    """
+    Get owners of several posts with one query.
+
+    :param post_ids: Posts ids in db.
+    :param session: SQLAlchemy session for querying.
+    :returns: A dictionary with post id as a key and owner id as a value (missing posts are absent).
+    """
+    stmt = sa.select(Post.id, Post.owner_id).where(Post.id.in_(post_ids))
+    return {str(post_id): str(owner_id) for post_id, owner_id in await session.execute(stmt)}
+
+
+async def insert_reactions(
+    reactions: List[Tuple[str, str, ReactionType]],
+    session: AsyncSession,
+    owners: Optional[Dict[str, str]] = None,
+) -> Set[Tuple[str, str]]:
+    """
+    Save several reactions to db with one multi-row insert.
+
+    Reactions on missing posts, on own posts and already existing reactions are skipped,
+    so the same reactions can be safely inserted again. Trending scores of the posts
+    are updated after commit.
+
+    :param reactions: A list of tuples with post id, user id and reaction type.
+    :param session: SQLAlchemy session for querying.
+    :param owners: Owners of the posts if they are already known (see `get_post_owners`).
+    :returns: A set of tuples with post id and user id of inserted reactions.
+    """
+    if not reactions:
+        return set()
+
+    if owners is None:
+        owners = await get_post_owners({post_id for post_id, _, _ in reactions}, session)
+    values = [
+        {"post_id": post_id, "user_id": user_id, "type": reaction}
+        for post_id, user_id, reaction in reactions
+        if str(post_id) in owners and owners[str(post_id)] != str(user_id)
+    ]
+    if not values:
+        return set()
+
+    stmt = (
+        postgresql.insert(Reaction)
+        .values(values)
+        # Primary key (user_id, post_id) doesn't allow reacting twice.
+        .on_conflict_do_nothing()
+        .returning(Reaction.post_id, Reaction.user_id, Reaction.type)
+    )
+    inserted = (await session.execute(stmt)).all()
+
+    if not inserted:
+        await session.commit()
+        return set()
+
+    # Counters are updated in the same transaction as the reactions, by one statement.
+    added = {}
+    for post_id, _, reaction in inserted:
+        post_added = added.setdefault(post_id, {react: 0 for react in ReactionType})
+        post_added[reaction] += 1
+    added_values = sa.values(
+        sa.column("post_id", Post.id.type),
+        *(sa.column(react.name, sa.Integer) for react in ReactionType),
+        name="added",
+    ).data([(post_id, *post_added.values()) for post_id, post_added in added.items()])
+    post_table = Post.__table__
+    counters = [post_table.c[reaction_counter(react).key] for react in ReactionType]
+    stmt = (
+        sa.update(post_table)
+        .where(post_table.c.id == added_values.c.post_id)
+        .values(
+            {
+                **{
+                    counter: counter + added_values.c[react.name]
+                    for react, counter in zip(ReactionType, counters)
+                },
+                # Reactions are not an edit of the post, so keep last_update_date as is.
+                post_table.c.last_update_date: post_table.c.last_update_date,
+            }
+        )
+        .returning(post_table.c.id, *counters)
+    )
+    counts = {
+        str(post_id): {react.name: count for react, count in zip(ReactionType, post_counts)}
+        for post_id, *post_counts in await session.execute(stmt)
+    }
+    await session.commit()
+
+    await trending.add_reaction_scores(
+        [(str(post_id), reaction) for post_id, _, reaction in inserted], counts
+    )
+    return {(str(post_id), str(user_id)) for post_id, user_id, _ in inserted}
+
+
+def reaction_counter(reaction: ReactionType) -> InstrumentedAttribute:
+    """
+    Get denormalized counter column for the reaction type.
+
+    :param reaction: Reaction type.
+    :returns: Post column that stores amount of such reactions.
+    """
+    return getattr(Post, f"{reaction.name}_count")
 
 
 async def delete_post(post_id: str, session: AsyncSession) -> None:
@@ -107,68 +433,281 @@ async def delete_post(post_id: str, session: AsyncSession) -> None:
     :param post_id: Post id in db.
     :param session: SQLAlchemy session for querying.
     """
-    stmt = sa.delete(Post).where(Post.id == post_id)
-    await session.execute(stmt)
+    stmt = sa.delete(Post).where(Post.id == post_id).returning(Post.owner_id)
+    owner_id = (await session.execute(stmt)).scalar()
     await session.commit()
     logger.info(f"Post {post_id} deleted")
+    await trending.remove_posts(post_id)
+
+    if settings.USE_CACHE:
+        await delete_cache_reactions(post_id)
+        await invalidate_posts(post_id, offset=True, owner_id=owner_id)
 
 
-async def get_posts(skip: int, session: AsyncSession) -> List[Dict[str, Any]]:
+async def get_posts(
+    session: AsyncSession,
+    skip: int = 0,
+    cursor: Optional[Tuple[datetime, UUID]] = None,
+    owner_id: Optional[str] = None,
+) -> Tuple[List[PostListItem], Optional[str]]:
     """
-    Get list of posts.
+    Get list of posts, newest first.
 
-    :param skip: Offset criterion in selection of posts. 
-    Should be a multiple of MAX_POSTS_COUNT_PER_PAGE.
     :param session: SQLAlchemy session for querying.
-    :returns: A list with posts presented in the form of dict.
+    :param skip: Offset criterion in selection of posts.
+    Should be a multiple of MAX_POSTS_COUNT_PER_PAGE. Ignored when cursor is given.
+    :param cursor: Creation date and id of the last post from the previous page.
+    :param owner_id: Get only posts of this user.
+    :returns: A list with posts presented in the form of pydantic models and
+    cursor for the next page (None if there are no more posts).
     """
-    # It is better not to use cached reactions, because basically (when getting post list)
-    # there will be situations when there will not be cached reactions
-    # for every post from the sample,
-    # and then you still need to make a request to get them from the database.
+    # Reactions are counted by denormalized counters of the post,
+    # so the list never touches the reaction table.
     stmt = (
         sa.select(Post)
-        .options(joinedload(Post.user_reactions))
-        .offset(skip)
-        .limit(MAX_POSTS_COUNT_PER_PAGE)
+        .order_by(Post.creation_date.desc(), Post.id.desc())
+        # One extra row tells whether the next page exists.
+        .limit(MAX_POSTS_COUNT_PER_PAGE + 1)
+    )
+    if owner_id is not None:
+        # Served by the (owner_id, creation_date DESC, id DESC) index.
+        stmt = stmt.where(Post.owner_id == owner_id)
+    if cursor is not None:
+        # Keyset pagination: seek by (creation_date, id) through the index
+        # instead of scanning and throwing away all the previous rows.
+        stmt = stmt.where(sa.tuple_(Post.creation_date, Post.id) < sa.tuple_(*cursor))
+    else:
+        stmt = stmt.offset(skip)
+    posts = (await session.scalars(stmt)).all()
+
+    next_cursor = None
+    if len(posts) > MAX_POSTS_COUNT_PER_PAGE:
+        posts = posts[:MAX_POSTS_COUNT_PER_PAGE]
+        next_cursor = encode_cursor(posts[-1].creation_date, posts[-1].id)
+
+    return post_list_items(posts), next_cursor
+
+
+def post_list_items(posts: Sequence[Post]) -> List[PostListItem]:
+    """
+    Present posts as list items.
+
+    Reactions are counted by denormalized counters of the post rows.
+
+    :param posts: Post objects.
+    :returns: A list with posts presented in the form of pydantic models.
+    """
+    return [PostListItem.model_validate(post) for post in posts]
+
+
+async def search_posts(
+    query: str,
+    session: AsyncSession,
+    cursor: Optional[Tuple[float, UUID]] = None,
+) -> Tuple[List[PostSearchItem], Optional[str]]:
+    """
+    Full-text search over titles and descriptions of posts, best matches first.
+
+    :param query: Search query in web search syntax ("quoted phrase", -excluded, or).
+    :param session: SQLAlchemy session for querying.
+    :param cursor: Rank and id of the last post from the previous page.
+    :returns: A list with found posts and cursor for the next page (None if there are no more posts).
+    """
+    # Config is cast explicitly, so that the driver sends it as text.
+    config = sa.cast(SEARCH_CONFIG, postgresql.REGCONFIG)
+    ts_query = sa.func.websearch_to_tsquery(config, query)
+    rank = sa.func.ts_rank_cd(Post.search_vector, ts_query)
+    # Matching posts are found through the GIN index, only they are ranked.
+    stmt = (
+        sa.select(Post.id, rank.label("rank"))
+        .where(Post.search_vector.op("@@")(ts_query))
+        .order_by(rank.desc(), Post.id.desc())
+        # One extra row tells whether the next page exists.
+        .limit(MAX_POSTS_COUNT_PER_PAGE + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(sa.tuple_(rank, Post.id) < sa.tuple_(*cursor))
+    page = stmt.subquery()
+
+    # Highlighting is slow, so only posts of the page are highlighted.
+    stmt = (
+        sa.select(
+            Post,
+            page.c.rank,
+            sa.func.ts_headline(config, Post.title, ts_query, SEARCH_HIGHLIGHT_OPTIONS),
+            sa.func.ts_headline(config, Post.description, ts_query, SEARCH_HIGHLIGHT_OPTIONS),
+        )
+        .join(page, Post.id == page.c.id)
+        .order_by(page.c.rank.desc(), Post.id.desc())
     )
-    posts = (await session.scalars(stmt)).unique().all()
-    posts_list = []
+    rows = (await session.execute(stmt)).all()
+
+    next_cursor = None
+    if len(rows) > MAX_POSTS_COUNT_PER_PAGE:
+        rows = rows[:MAX_POSTS_COUNT_PER_PAGE]
+        next_cursor = encode_search_cursor(rows[-1].rank, rows[-1][0].id)
 
-    for post in posts:
-        post_dict = post._asdict()
-        # Counter for each reaction
-        post_dict["reactions"] = {react.name: 0 for react in ReactionType}
-        for reaction in post.user_reactions:
-            post_dict["reactions"][reaction.type.name] += 1
-        posts_list.append(post_dict)
+    items = post_list_items([row[0] for row in rows])
+    return [
+        PostSearchItem.model_construct(
+            **dict(item),
+            rank=row.rank,
+            # Highlights contain raw user text, it is escaped before adding the tags.
+            title_highlight=highlight_to_html(row[2]),
+            description_highlight=highlight_to_html(row[3]),
+        )
+        for item, row in zip(items, rows)
+    ], next_cursor
 
-    return posts_list
 
+async def get_top_posts(
+    window: trending.TrendingWindow, limit: int, session: AsyncSession
+) -> List[TopPost]:
+    """
+    Get posts with the highest trending scores in the window.
 
-async def get_reactions(post: Post, session: AsyncSession) -> Dict[str, Set[str]]:
+    Post ids come from the redis leaderboard, posts are loaded by one query.
+
+    :param window: Trending window.
+    :param limit: Amount of posts.
+    :param session: SQLAlchemy session for querying.
+    :returns: A list with posts and their scores, the highest score first.
+    """
+    top = await trending.get_top(window, limit)
+    if not top:
+        return []
+    stmt = sa.select(Post).where(Post.id.in_([post_id for post_id, _ in top]))
+    posts = {str(post.id): post for post in await session.scalars(stmt)}
+
+    # Posts deleted after the leaderboard was read are skipped.
+    found = [(posts[post_id], score) for post_id, score in top if post_id in posts]
+    items = post_list_items([post for post, _ in found])
+    return [
+        TopPost.model_construct(**dict(item), score=score)
+        for item, (_, score) in zip(items, found)
+    ]
+
+
+async def export_posts() -> AsyncGenerator[bytes, None]:
+    """
+    Export all posts as NDJSON (one json object per line).
+
+    Posts are read through a server-side cursor in chunks,
+    so memory usage doesn't depend on the amount of posts.
+
+    :returns: An async generator yielding chunks of NDJSON lines.
+    """
+    stmt = (
+        sa.select(Post)
+        .order_by(Post.creation_date, Post.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    # Own session: the generator is consumed after the request handler has returned.
+    async with get_read_session_maker()() as session:
+        posts = await session.stream_scalars(stmt)
+        async for chunk in posts.partitions():
+            yield "".join(
+                json.dumps(post._asdict(), default=json_default) + "\n" for post in chunk
+            ).encode()
+            # Exported posts are not needed anymore.
+            session.expunge_all()
+
+
+async def get_reactions(post_id: str, session: AsyncSession) -> Dict[str, Set[str]]:
     """
     Get reactions under specified post.
 
-    :param post: A Post object.
+    Reactions are looked up in redis and only then in db, reactions read from a replica are not cached.
+    Returned dict is shared with the cache and must not be modified.
+
+    :param post_id: Post id in db.
     :param session: SQLAlchemy session for querying.
     :returns: A dictionary with reaction type as a key and set of reacted users id's as a value.
     """
-    cached = None
+    post_id = str(post_id)
+    reactions = None
 
     if settings.USE_CACHE:
-        cache_key = build_key("reactions", str(post.id))
-        cached = await redis_client.redis.get(cache_key)
-
-    if cached is None:
-        # Fetch related user_reactions from db.
-        await session.refresh(post, attribute_names=["user_reactions"])
-        reactions = {react_type.name: set() for react_type in ReactionType}
-        # Add user_id to specific reaction under the post.
-        [
-            reactions[react.type.name].add(str(react.user_id))
-            for react in post.user_reactions
-        ]
-    else:
-        reactions = pickle.loads(cached)
+        cached = await get_cache_reactions(post_id)
+        if cached is not None:
+            reactions, stale = cached
+            if stale:
+                # Stale reactions are returned right away and refreshed in background.
+                refresh_reactions(post_id)
+
+    if reactions is None:
+        if settings.USE_CACHE and is_primary(session):
+            # Only one request rebuilds the cache, concurrent ones wait for its result.
+            reactions = await single_flight.do(
+                build_key("reactions", post_id),
+                lambda: load_reactions(post_id, session),
+                lambda: read_cache_reactions(post_id),
+            )
+        else:
+            reactions = await load_reactions(post_id, session)
+    return reactions
+
+
+async def read_cache_reactions(
+    post_id: str, fresh_only: bool = False
+) -> Optional[Dict[str, Set[str]]]:
+    """
+    Read reactions under specified post from redis.
+
+    :param post_id: Post id in db.
+    :param fresh_only: Treat stale reactions as missing.
+    :returns: A dictionary with reaction type as a key and set of reacted users id's as a value
+    or None if reactions are not cached.
+    """
+    cached = await get_cache_reactions(post_id)
+    if cached is None or (fresh_only and cached[1]):
+        return None
+    return cached[0]
+
+
+def refresh_reactions(post_id: str) -> None:
+    """
+    Schedule background refresh of cached reactions under specified post.
+
+    :param post_id: Post id in db.
+    """
+    if post_id in _refreshing:
+        return
+
+    async def refresh() -> None:
+        try:
+            async with async_session_maker() as session:
+                await single_flight.do(
+                    build_key("reactions", post_id),
+                    lambda: load_reactions(post_id, session),
+                    lambda: read_cache_reactions(post_id, fresh_only=True),
+                )
+        except Exception:
+            logger.exception(f"Failed to refresh reactions of Post {post_id}")
+        finally:
+            _refreshing.pop(post_id, None)
+
+    # Task is referenced until it is done, otherwise it can be garbage collected.
+    _refreshing[post_id] = asyncio.create_task(refresh())
+
+
+async def load_reactions(post_id: str, session: AsyncSession) -> Dict[str, Set[str]]:
+    """
+    Load reactions under specified post from db and put them into the cache.
+
+    Cached reactions are long-lived and reject repeated reactions, so only reactions
+    read from the primary db are put into the cache.
+
+    :param post_id: Post id in db.
+    :param session: SQLAlchemy session for querying.
+    :returns: A dictionary with reaction type as a key and set of reacted users id's as a value.
+    """
+    stmt = sa.select(Reaction.user_id, Reaction.type).where(Reaction.post_id == post_id)
+    reactions = {react_type.name: set() for react_type in ReactionType}
+    rows = await session.execute(stmt)
+    # Add user_id to specific reaction under the post.
+    for user_id, react_type in rows:
+        reactions[react_type.name].add(str(user_id))
+    if settings.USE_CACHE and is_primary(session):
+        await update_cache_reactions(reactions, post_id)
     return reactions
@@ -0,0 +1,240 @@
+"""
+Trending posts leaderboards kept in redis sorted sets.
+
+Every reaction adds its weight to the score of the post in the "hour" and "day" windows.
+These scores decay exponentially with the half-life of the window, so old reactions fade out
+without any background job. Instead of decaying all the scores on every write, new reactions
+are weighted up: a reaction at time t adds `weight * 2 ** ((t - epoch) / half_life)`.
+Ordering doesn't depend on the scale, and when the factor grows too big, scores of the set
+are scaled down and the epoch is moved to now. Posts leave a decaying set only when their
+score has decayed below TRENDING_MIN_SCORE, so nothing but negligible scores is ever dropped.
+
+The "all" window doesn't decay, its score is set from the reaction counters of the post in db.
+The set is capped by TRENDING_MAX_POSTS: a trimmed post comes back with its full score
+on its next reaction.
+"""
+import enum
+import math
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+from cache_base import build_key, redis_client
+from posts.models import Post, Reaction, ReactionType
+
+
+class TrendingWindow(str, enum.Enum):
+    hour = "hour"
+    day = "day"
+    all = "all"
+
+
+# Half-life of reaction weight in every window, None - reactions don't decay.
+HALF_LIFE_SEC: Dict[TrendingWindow, Optional[int]] = {
+    TrendingWindow.hour: 60 * 60,
+    TrendingWindow.day: 24 * 60 * 60,
+    TrendingWindow.all: None,
+}
+REACTION_WEIGHTS = {ReactionType.like: 1, ReactionType.dislike: -1}
+# Scores are rescaled when the weight of a new reaction reaches 2 ** RESCALE_EXPONENT.
+RESCALE_EXPONENT = 64
+# Reactions older than this amount of half-lives weigh less than 2 ** -REBUILD_HALF_LIVES
+# and are left out on rebuild.
+REBUILD_HALF_LIVES = 20
+# Amount of posts added to the rebuilt set by one command.
+REBUILD_BATCH_SIZE = 10000
+EPOCHS_KEY = build_key("trending", "epochs")
+
+# Updates scores of the posts in all windows.
+# KEYS[1] - hash with epoch of every window, KEYS[2..] - sorted sets of the windows.
+# ARGV[1] - current time, ARGV[2] - rescale exponent, ARGV[3] - min score of decaying sets,
+# ARGV[4] - max size of not decaying sets, ARGV[5..4+n] - half-life of every window (0 - no decay),
+# then triples of post id, weight of its new reactions and its total score.
+ADD_SCORES_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rescale_exponent = tonumber(ARGV[2])
+local min_score = tonumber(ARGV[3])
+local max_size = tonumber(ARGV[4])
+local n = #KEYS - 1
+for i = 1, n do
+    local key = KEYS[i + 1]
+    local half_life = tonumber(ARGV[4 + i])
+    if half_life > 0 then
+        local epoch = tonumber(redis.call('HGET', KEYS[1], key))
+        if epoch == nil then
+            epoch = now
+            redis.call('HSET', KEYS[1], key, epoch)
+        end
+        local exponent = (now - epoch) / half_life
+        if exponent >= rescale_exponent then
+            local scale = 2 ^ -exponent
+            local scores = redis.call('ZRANGE', key, 0, -1, 'WITHSCORES')
+            for j = 1, #scores, 2 do
+                redis.call('ZADD', key, tonumber(scores[j + 1]) * scale, scores[j])
+            end
+            redis.call('HSET', KEYS[1], key, now)
+            exponent = 0
+        end
+        local factor = 2 ^ exponent
+        for j = 5 + n, #ARGV, 3 do
+            redis.call('ZINCRBY', key, tonumber(ARGV[j + 1]) * factor, ARGV[j])
+        end
+        -- Posts which scores have decayed to almost zero leave the set.
+        local floor = min_score * factor
+        redis.call('ZREMRANGEBYSCORE', key, '(' .. -floor, '(' .. floor)
+    else
+        for j = 5 + n, #ARGV, 3 do
+            redis.call('ZADD', key, ARGV[j + 2], ARGV[j])
+        end
+        redis.call('ZREMRANGEBYRANK', key, 0, -max_size - 1)
+    end
+end
+return 0
+"""
+
+_add_scores_script = None
+
+
+def window_key(window: TrendingWindow) -> str:
+    """
+    Build key of the sorted set of the window.
+
+    :param window: Trending window.
+    :returns: Key in redis.
+    """
+    return build_key("trending", window.value)
+
+
+async def add_reaction_scores(
+    reactions: Iterable[Tuple[str, ReactionType]], counts: Dict[str, Dict[str, int]]
+) -> None:
+    """
+    Add new saved reactions to the scores of the posts in one round trip.
+
+    :param reactions: Post id and type of every new reaction.
+    :param counts: A dictionary with post id as a key and dictionary with amount of each reaction type
+    (after the new reactions were saved) as a value.
+    """
+    global _add_scores_script
+    weights: Dict[str, int] = {}
+    for post_id, reaction in reactions:
+        weights[str(post_id)] = weights.get(str(post_id), 0) + REACTION_WEIGHTS[reaction]
+    if not weights:
+        return
+    if _add_scores_script is None:
+        _add_scores_script = redis_client.redis.register_script(ADD_SCORES_SCRIPT)
+
+    args = [time.time(), RESCALE_EXPONENT, settings.TRENDING_MIN_SCORE, settings.TRENDING_MAX_POSTS]
+    args.extend(HALF_LIFE_SEC[window] or 0 for window in TrendingWindow)
+    for post_id, weight in weights.items():
+        args.extend((post_id, weight, total_score(counts[post_id])))
+    await _add_scores_script(
+        keys=[EPOCHS_KEY, *(window_key(window) for window in TrendingWindow)], args=args
+    )
+
+
+def total_score(counts: Dict[str, int]) -> int:
+    """
+    Get not decaying score of the post.
+
+    :param counts: A dictionary with reaction type as a key and amount of reactions as a value.
+    :returns: Score of the post in the "all" window.
+    """
+    return sum(weight * counts[react.name] for react, weight in REACTION_WEIGHTS.items())
+
+
+async def remove_posts(*post_ids: str) -> None:
+    """
+    Remove the posts from all windows.
+
+    :param post_ids: Posts ids in db.
+    """
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        for window in TrendingWindow:
+            pipe.zrem(window_key(window), *post_ids)
+        await pipe.execute()
+
+
+async def get_top(window: TrendingWindow, limit: int) -> List[Tuple[str, float]]:
+    """
+    Get the posts with the highest scores in the window.
+
+    :param window: Trending window.
+    :param limit: Amount of posts.
+    :returns: A list of tuples with post id and its current score, the highest score first.
+    """
+    key = window_key(window)
+    async with redis_client.redis.pipeline(transaction=False) as pipe:
+        pipe.hget(EPOCHS_KEY, key)
+        pipe.zrevrange(key, 0, limit - 1, withscores=True)
+        epoch, top = await pipe.execute()
+
+    half_life = HALF_LIFE_SEC[window]
+    scale = 1.0
+    if half_life is not None and epoch is not None:
+        # Stored scores are relative to the epoch, bring them to now.
+        scale = 2 ** ((float(epoch) - time.time()) / half_life)
+    return [(post_id.decode(), score * scale) for post_id, score in top]
+
+
+async def rebuild(session: AsyncSession) -> Dict[TrendingWindow, int]:
+    """
+    Recompute scores of all windows from db and replace the sorted sets.
+
+    The "all" window is taken from denormalized reaction counters of the posts,
+    decaying windows aggregate only reactions of the last REBUILD_HALF_LIVES half-lives.
+
+    :param session: SQLAlchemy session for querying.
+    :returns: A dictionary with window as a key and amount of posts in its set as a value.
+    """
+    now = time.time()
+    weight = sa.case(
+        *((Reaction.type == react, value) for react, value in REACTION_WEIGHTS.items()), else_=0
+    )
+    sizes = {}
+    for window in TrendingWindow:
+        half_life = HALF_LIFE_SEC[window]
+        if half_life is None:
+            counters = {react: getattr(Post, f"{react.name}_count") for react in ReactionType}
+            score = sum(REACTION_WEIGHTS[react] * counter for react, counter in counters.items())
+            stmt = (
+                sa.select(Post.id, score.label("score"))
+                .where(sa.or_(*(counter > 0 for counter in counters.values())))
+                .order_by(sa.desc("score"))
+                .limit(settings.TRENDING_MAX_POSTS)
+            )
+        else:
+            # Scores are computed relative to now, so the epoch of the rebuilt set is now.
+            age = sa.func.extract("epoch", sa.func.now() - Reaction.created_at)
+            score = sa.func.sum(weight * sa.func.exp(-math.log(2) * age / half_life))
+            max_age = timedelta(seconds=half_life * REBUILD_HALF_LIVES)
+            stmt = (
+                sa.select(Reaction.post_id, score)
+                .where(Reaction.created_at > sa.func.now() - max_age)
+                .group_by(Reaction.post_id)
+                # The same floor as on writes.
+                .having(sa.func.abs(score) >= settings.TRENDING_MIN_SCORE)
+            )
+        scores = {str(post_id): float(value) for post_id, value in await session.execute(stmt)}
+
+        # The new set is built aside and swapped in at once.
+        key = window_key(window)
+        new_key = build_key(key, "rebuild")
+        async with redis_client.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(new_key)
+            if scores:
+                items = list(scores.items())
+                for i in range(0, len(items), REBUILD_BATCH_SIZE):
+                    pipe.zadd(new_key, dict(items[i : i + REBUILD_BATCH_SIZE]))
+                pipe.rename(new_key, key)
+            else:
+                pipe.delete(key)
+            if half_life is not None:
+                pipe.hset(EPOCHS_KEY, key, now)
+            await pipe.execute()
+        sizes[window] = len(scores)
+    return sizes
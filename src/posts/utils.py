@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import html
+import json
+import math
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def encode_cursor(creation_date: datetime, post_id: UUID) -> str:
+    """
+    Builds an opaque pagination cursor pointing at the given post.
+
+    :param creation_date: Creation date of the last post on the page.
+    :param post_id: Id of the last post on the page.
+    :returns: Url-safe base64 string.
+    """
+    raw = json.dumps([creation_date.isoformat(), str(post_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Restores position from cursor built by `encode_cursor`.
+
+    :param cursor: Opaque cursor given to the client.
+    :raises ValueError: Cursor is malformed.
+    :returns: A tuple with creation date and post id.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    creation_date, post_id = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(creation_date, str) or not isinstance(post_id, str):
+        raise ValueError("Cursor parts must be strings")
+    creation_date = datetime.fromisoformat(creation_date)
+    # Creation dates are stored without timezone, an aware one can't be compared with them.
+    if creation_date.tzinfo is not None:
+        raise ValueError("Cursor date must not have timezone")
+    return creation_date, UUID(post_id)
+
+
+def encode_search_cursor(rank: float, post_id: UUID) -> str:
+    """
+    Builds an opaque search pagination cursor pointing at the given post.
+
+    :param rank: Search rank of the last post on the page.
+    :param post_id: Id of the last post on the page.
+    :returns: Url-safe base64 string.
+    """
+    raw = json.dumps([rank, str(post_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, UUID]:
+    """
+    Restores position from cursor built by `encode_search_cursor`.
+
+    :param cursor: Opaque cursor given to the client.
+    :raises ValueError: Cursor is malformed.
+    :returns: A tuple with search rank and post id.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    rank, post_id = json.loads(base64.urlsafe_b64decode(padded))
+    if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not isinstance(post_id, str):
+        raise ValueError("Cursor must contain a number and a string")
+    if not math.isfinite(rank):
+        raise ValueError("Cursor rank must be finite")
+    return float(rank), UUID(post_id)
+
+
+# Markers of matched words in `ts_headline` output, private use characters can't be mistaken for markup.
+HIGHLIGHT_START = "\ue000"
+HIGHLIGHT_STOP = "\ue001"
+
+
+def highlight_to_html(headline: Optional[str]) -> Optional[str]:
+    """
+    Builds safe html from `ts_headline` output: user text is escaped
+    and only the matched words are wrapped in `<b></b>`.
+
+    :param headline: Text with matched words between HIGHLIGHT_START and HIGHLIGHT_STOP.
+    :returns: Escaped html.
+    """
+    if headline is None:
+        return None
+    return html.escape(headline).replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_STOP, "</b>")
+
+
+def json_default(value: Any) -> str:
+    """
+    Serialize values unknown to json module (dates, UUIDs).
+
+    :param value: A value to serialize.
+    :returns: String representation of the value.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Builds a strong ETag of the response.
+
+    :param body: Serialized response.
+    :returns: Quoted hash of the response.
+    """
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ModelResponse(JSONResponse):
+    """
+    JSON response for pydantic models.
+
+    Models are dumped to JSON by pydantic serializer directly, skipping
+    `jsonable_encoder` and validation against the response model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return super().render(content)
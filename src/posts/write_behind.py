@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import ResponseError
+from sqlalchemy.exc import DataError, IntegrityError
+
+import settings
+from cache_base import redis_client
+from database import async_session_maker
+from posts import service
+from posts.cache import invalidate_posts, pending_key
+from posts.models import ReactionType
+
+
+logger = logging.getLogger("uvicorn")
+
+_flusher: Optional[asyncio.Task] = None
+_stopping = False
+
+
+async def start_flusher() -> None:
+    """Start background task saving accepted reactions to db."""
+    global _flusher, _stopping
+    try:
+        await redis_client.redis.xgroup_create(
+            settings.REACTIONS_STREAM, settings.REACTIONS_STREAM_GROUP, id="0", mkstream=True
+        )
+    except ResponseError as e:
+        # Group is already created by another worker.
+        if "BUSYGROUP" not in str(e):
+            raise
+    _stopping = False
+    _flusher = asyncio.create_task(flush_reactions())
+
+
+async def stop_flusher() -> None:
+    """
+    Stop background task saving accepted reactions to db.
+
+    The flusher finishes its current batch, it is cancelled only if that takes
+    longer than REACTIONS_FLUSHER_STOP_TIMEOUT_SEC (not acknowledged reactions
+    are saved later by another flusher).
+    """
+    global _flusher, _stopping
+    if _flusher is None:
+        return
+    _stopping = True
+    try:
+        await asyncio.wait_for(_flusher, settings.REACTIONS_FLUSHER_STOP_TIMEOUT_SEC)
+    except asyncio.TimeoutError:
+        logger.warning("Reactions flusher hasn't stopped in time, cancelled")
+    _flusher = None
+
+
+async def flush_reactions() -> None:
+    """
+    Save reactions from the redis stream to db in batches.
+
+    Reactions are acknowledged only after they are committed, so reactions of the flusher
+    that has died are taken over by other flushers and inserted again (inserting is idempotent).
+    """
+    redis = redis_client.redis
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    # Own not acknowledged reactions are read first, then new ones.
+    last_id = "0"
+    claimed_at = 0.0
+
+    while not _stopping:
+        try:
+            # Claimed reactions can be read again as own not acknowledged ones.
+            entries = {}
+            if time.monotonic() - claimed_at > settings.REACTIONS_FLUSH_CLAIM_IDLE_MS / 1000:
+                # Take over reactions read by the flushers that have died.
+                _, claimed, *_ = await redis.xautoclaim(
+                    settings.REACTIONS_STREAM,
+                    settings.REACTIONS_STREAM_GROUP,
+                    consumer,
+                    min_idle_time=settings.REACTIONS_FLUSH_CLAIM_IDLE_MS,
+                    count=settings.REACTIONS_FLUSH_BATCH_SIZE,
+                )
+                entries.update(entry for entry in claimed if entry[1])
+                claimed_at = time.monotonic()
+
+            response = await redis.xreadgroup(
+                settings.REACTIONS_STREAM_GROUP,
+                consumer,
+                {settings.REACTIONS_STREAM: last_id},
+                count=settings.REACTIONS_FLUSH_BATCH_SIZE,
+                block=settings.REACTIONS_FLUSH_INTERVAL_MS,
+            )
+            read = response[0][1] if response else []
+            if last_id == "0" and not read:
+                last_id = ">"
+            entries.update(entry for entry in read if entry[1])
+
+            if entries:
+                await save_entries(list(entries.items()))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to flush reactions, retrying")
+            # Not acknowledged reactions are read again.
+            last_id = "0"
+            await asyncio.sleep(1)
+
+
+async def save_entries(entries: List[Tuple[bytes, Dict[bytes, bytes]]]) -> None:
+    """
+    Save reactions from the stream entries to db and acknowledge them.
+
+    If the batch can't be saved because of its data, reactions are saved one by one
+    and the ones that fail are moved to the dead-letter stream, so one bad reaction
+    doesn't block the others.
+
+    :param entries: A list of tuples with entry id and entry fields.
+    """
+    failed: Dict[bytes, str] = {}
+    reactions = {}
+    for entry_id, fields in entries:
+        try:
+            reactions[entry_id] = parse_entry(fields)
+        except (KeyError, ValueError) as e:
+            failed[entry_id] = f"Invalid entry: {e!r}"
+
+    try:
+        inserted = await insert_reactions(list(reactions.values()))
+    except (IntegrityError, DataError):
+        logger.warning(f"Failed to save batch of {len(reactions)} reactions, saving one by one")
+        inserted = set()
+        for entry_id, reaction in reactions.items():
+            try:
+                inserted |= await insert_reactions([reaction])
+            except (IntegrityError, DataError) as e:
+                failed[entry_id] = str(e.orig)
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    async with redis_client.redis.pipeline(transaction=True) as pipe:
+        for entry_id, fields in entries:
+            if entry_id in failed:
+                logger.warning(f"Reaction {fields} is moved to dead-letter stream: {failed[entry_id]}")
+                pipe.xadd(
+                    settings.REACTIONS_DEAD_LETTER_STREAM,
+                    {**fields, "entry_id": entry_id, "error": failed[entry_id]},
+                    maxlen=settings.REACTIONS_DEAD_LETTER_MAX_LEN,
+                    approximate=True,
+                )
+            if b"post_id" in fields and b"user_id" in fields:
+                # The reaction is in db (or never will be), reaction sets rebuilt from db are complete.
+                pipe.hdel(pending_key(fields[b"post_id"].decode()), fields[b"user_id"])
+        pipe.xack(settings.REACTIONS_STREAM, settings.REACTIONS_STREAM_GROUP, *entry_ids)
+        pipe.xdel(settings.REACTIONS_STREAM, *entry_ids)
+        await pipe.execute()
+    logger.info(f"Flushed {len(inserted)} of {len(entries)} reactions")
+
+    if inserted:
+        # Counters of the posts in db have changed.
+        post_ids = {post_id for post_id, _ in inserted}
+        await invalidate_posts(*post_ids)
+
+
+async def insert_reactions(reactions: List[Tuple[str, str, ReactionType]]) -> Set[Tuple[str, str]]:
+    """
+    Save reactions to db in a separate transaction.
+
+    :param reactions: A list of tuples with post id, user id and reaction type.
+    :returns: A set of tuples with post id and user id of inserted reactions.
+    """
+    async with async_session_maker() as session:
+        return await service.insert_reactions(reactions, session)
+
+
+def parse_entry(fields: Dict[bytes, Any]) -> Tuple[str, str, ReactionType]:
+    """
+    Parse reaction from the stream entry.
+
+    :param fields: Fields of the stream entry.
+    :returns: A tuple with post id, user id and reaction type.
+    """
+    return (
+        fields[b"post_id"].decode(),
+        fields[b"user_id"].decode(),
+        ReactionType[fields[b"type"].decode()],
+    )
@@ -0,0 +1,27 @@
+"""
+Rebuild trending posts leaderboards from db.
+
+Usage (from src/ folder):
+    python rebuild_trending.py
+
+Needed after redis data loss, bulk loads of reactions (see `generate_dataset.py`)
+or changes of reaction weights and half-lives. Reactions added while the command runs
+may be missing from the rebuilt leaderboards.
+"""
+import asyncio
+
+from cache_base import redis_client
+from database import async_session_maker
+from posts import trending
+
+
+async def rebuild() -> None:
+    """Recompute all trending windows."""
+    async with redis_client.connected(), async_session_maker() as session:
+        sizes = await trending.rebuild(session)
+    for window, size in sizes.items():
+        print(f"{window.value}: {size} posts")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
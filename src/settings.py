@@ -11,6 +11,8 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
+# Read replicas as comma separated "host:port" (same user, password and db name as the primary)
+DB_REPLICA_HOSTS = [host for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host]
 
 # JWT Secret
 JWT_SECRET = os.getenv("JWT_SECRET")
@@ -20,8 +22,68 @@ REDIS_URL = os.getenv("REDIS_URL")
 REDIS_PORT = os.getenv("REDIS_PORT")
 
 # ---------- non-Confidential ----------
+# DB connection pool (per uvicorn worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+# Connections older than this are reconnected, -1 - never
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+# Amount of prepared statements cached per connection, 0 - disable
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Connect through PgBouncer in transaction pooling mode (disables pool and statement caches)
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# After a write the client reads from the primary during this time, so it sees its own writes
+# despite replication lag, 0 - disable
+READ_YOUR_WRITES_WINDOW_SEC = int(os.getenv("READ_YOUR_WRITES_WINDOW_SEC", 5))
+READ_YOUR_WRITES_COOKIE = "read_primary"
+
 # Caching
 USE_CACHE = True
+# In-process (L1) cache in front of redis
+L1_CACHE_MAX_SIZE = 10000
+L1_CACHE_LIFETIME_SEC = 5
+# Redis pub/sub channel used to drop stale L1 values in every worker
+CACHE_INVALIDATION_CHANNEL = "cache-invalidation"
+# Only one loader rebuilds a missing cache value, others wait for its result
+SINGLE_FLIGHT_LOCK_LIFETIME_MS = 3000
+SINGLE_FLIGHT_POLL_INTERVAL_SEC = 0.02
+# Serve stale cached reactions while they are refreshed in background
+REACTIONS_CACHE_STALE_WHILE_REVALIDATE = True
+# Whole responses are cached with tags and dropped when any of their tags is invalidated
+RESPONSE_CACHE_LIFETIME_SEC = 60
+# Responses loaded from a replica may lag behind the tag versions they are stored with,
+# so they are cached for a short time only
+REPLICA_RESPONSE_CACHE_LIFETIME_SEC = 5
+# Tag versions live longer than any response tagged with them
+TAG_VERSION_LIFETIME_SEC = 24 * 60 * 60
+
+# Write-behind reactions: reactions are accepted into a redis stream (requires USE_CACHE)
+# and saved to db in batches by a background flusher
+REACTIONS_WRITE_BEHIND = os.getenv("REACTIONS_WRITE_BEHIND", "false").lower() == "true"
+REACTIONS_STREAM = "reactions:stream"
+REACTIONS_STREAM_GROUP = "reactions-flushers"
+REACTIONS_FLUSH_BATCH_SIZE = 500
+REACTIONS_FLUSH_INTERVAL_MS = 200
+# Reactions read by a flusher that has died are taken over after this time
+REACTIONS_FLUSH_CLAIM_IDLE_MS = 30000
+# Reactions which can't be saved (e.g. of a deleted user) are moved to this stream
+REACTIONS_DEAD_LETTER_STREAM = "reactions:dead-letter"
+REACTIONS_DEAD_LETTER_MAX_LEN = 10000
+# On shutdown the flusher finishes its current batch within this time
+REACTIONS_FLUSHER_STOP_TIMEOUT_SEC = 10
+
+# Trending posts: posts leave hourly and daily leaderboards when their decayed score
+# falls below this value (in absolute value)
+TRENDING_MIN_SCORE = 0.01
+# Posts kept in the all-time leaderboard, far more than GET /posts/top serves
+TRENDING_MAX_POSTS = 10000
+
+# Password hashing: "thread" or "process" pool executor
+PASSWORD_HASHING_EXECUTOR = os.getenv("PASSWORD_HASHING_EXECUTOR", "thread")
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", 4))
+# Hashes computed at once by one uvicorn worker, other requests wait
+PASSWORD_HASHING_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASHING_MAX_CONCURRENCY", 4))
 
 # Logging
 LOG_CONFIG = {
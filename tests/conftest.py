@@ -0,0 +1,45 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+# Settings are read on import, db and redis are never connected to by the tests.
+for name, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "test",
+    "DB_USER": "test",
+    "DB_PASS": "test",
+    "JWT_SECRET": "test",
+    "REDIS_URL": "localhost",
+    "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from cache_base import redis_client, single_flight, tag_cache  # noqa: E402
+from auth import cache as user_cache  # noqa: E402
+from posts import cache, trending  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """Fake redis with lua scripting in place of the real one."""
+    client = fakeredis.FakeAsyncRedis()
+    redis_client.local.clear()
+    monkeypatch.setattr(redis_client, "redis", client)
+    # Scripts are registered lazily on the client they were first called with.
+    monkeypatch.setattr(cache, "_add_reaction_script", None)
+    monkeypatch.setattr(cache, "_merge_reactions_script", None)
+    monkeypatch.setattr(trending, "_add_scores_script", None)
+    monkeypatch.setattr(user_cache, "_set_user_script", None)
+    monkeypatch.setattr(single_flight, "_release_lock", None)
+    for attr in ("_get", "_set", "_invalidate"):
+        monkeypatch.setattr(tag_cache, attr, None)
+    return client
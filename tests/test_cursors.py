@@ -0,0 +1,56 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from posts.dependencies import validate_cursor, validate_search_cursor
+from posts.utils import encode_cursor, encode_search_cursor
+
+
+def raw_cursor(*parts):
+    return base64.urlsafe_b64encode(json.dumps(parts).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    position = (datetime(2020, 1, 1, 12, 30), uuid.uuid4())
+    assert validate_cursor(encode_cursor(*position)) == position
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        raw_cursor("2020-01-01"),
+        raw_cursor("2020-01-01", 123),
+        raw_cursor(123, str(uuid.uuid4())),
+        raw_cursor("2020-01-01T00:00:00+03:00", str(uuid.uuid4())),
+        raw_cursor("yesterday", str(uuid.uuid4())),
+    ],
+)
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        validate_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_search_cursor_round_trip():
+    position = (0.5, uuid.uuid4())
+    assert validate_search_cursor(encode_search_cursor(*position)) == position
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        raw_cursor(0.5, 5),
+        raw_cursor("0.5", str(uuid.uuid4())),
+        raw_cursor(True, str(uuid.uuid4())),
+        base64.urlsafe_b64encode(f'[NaN, "{uuid.uuid4()}"]'.encode()).decode(),
+    ],
+)
+def test_bad_search_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        validate_search_cursor(cursor)
+    assert error.value.status_code == 400
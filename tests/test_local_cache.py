@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+import settings
+from cache_base import MISSING, LocalCache, redis_client
+
+
+def test_zero_lifetime_is_not_default():
+    local = LocalCache(max_size=10, lifetime_sec=60)
+    local.set("key", "value", lifetime_sec=0)
+    assert local.get("key") is MISSING
+
+
+def test_deleted_tag_deletes_dependent_values():
+    local = LocalCache(max_size=10, lifetime_sec=60)
+    local.set("page", "body", tags=["tag:1", "tag:2"])
+    local.set("post", "body", tags=["tag:2"])
+    local.set("other", "body", tags=["tag:3"])
+
+    local.delete("tag:2")
+
+    assert local.get("page") is MISSING
+    assert local.get("post") is MISSING
+    assert local.get("other") == "body"
+
+
+@pytest.mark.anyio
+async def test_listener_survives_bad_messages(redis):
+    listener = asyncio.ensure_future(redis_client._listen_invalidations())
+    try:
+        # Wait for the subscription.
+        while not (await redis.pubsub_numsub(settings.CACHE_INVALIDATION_CHANNEL))[0][1]:
+            await asyncio.sleep(0.01)
+        redis_client.local.set("a", 1)
+        await redis.publish(settings.CACHE_INVALIDATION_CHANNEL, "not json")
+        await redis.publish(settings.CACHE_INVALIDATION_CHANNEL, '{"a": 1}')
+        redis_client.local.set("b", 2)
+        await redis.publish(settings.CACHE_INVALIDATION_CHANNEL, '["b"]')
+        for _ in range(100):
+            if redis_client.local.get("b") is MISSING:
+                break
+            await asyncio.sleep(0.01)
+
+        assert redis_client.local.get("b") is MISSING
+        assert not listener.done()
+    finally:
+        listener.cancel()
@@ -0,0 +1,62 @@
+import threading
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi_users.password import PasswordHelper
+
+from auth.manager import UserManager
+from auth.password import password_helper
+from auth.schemas import UserCreate
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeUserDatabase:
+    def __init__(self):
+        self.users = {}
+
+    async def get_by_email(self, email):
+        return self.users.get(email)
+
+    async def create(self, create_dict):
+        user = SimpleNamespace(id=uuid.uuid4(), is_active=True, is_verified=False, **create_dict)
+        self.users[user.email] = user
+        return user
+
+    async def update(self, user, update_dict):
+        for key, value in update_dict.items():
+            setattr(user, key, value)
+        return user
+
+
+@pytest.fixture
+def sync_calls(monkeypatch):
+    """Passwords hashed or verified in the event loop thread."""
+    calls = []
+    for name in ("hash", "verify_and_update"):
+        original = getattr(PasswordHelper, name)
+
+        def counted(self, *args, original=original, name=name):
+            if threading.current_thread() is threading.main_thread():
+                calls.append(name)
+            return original(self, *args)
+
+        monkeypatch.setattr(PasswordHelper, name, counted)
+    return calls
+
+
+async def test_passwords_are_hashed_in_executor(sync_calls):
+    manager = UserManager(FakeUserDatabase(), password_helper)
+    user = await manager.create(
+        UserCreate(email="user@example.com", password="password", username="user")
+    )
+
+    def credentials(username, password):
+        return SimpleNamespace(username=username, password=password)
+
+    assert await manager.authenticate(credentials("user@example.com", "password")) is user
+    assert await manager.authenticate(credentials("user@example.com", "wrong")) is None
+    assert await manager.authenticate(credentials("unknown@example.com", "password")) is None
+    assert sync_calls == []
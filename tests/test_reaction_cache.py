@@ -0,0 +1,65 @@
+import pytest
+
+import settings
+from posts import cache
+from posts.models import ReactionType
+
+
+pytestmark = pytest.mark.anyio
+
+
+def loaded(likes=(), dislikes=()):
+    return {"like": set(likes), "dislike": set(dislikes)}
+
+
+async def get_counts(post_id):
+    counts_key, _ = cache.reaction_keys(post_id)
+    counts = await cache.redis_client.redis.hmget(counts_key, "like", "dislike")
+    return [int(count) for count in counts]
+
+
+async def test_not_cached_reactions_are_not_added(redis):
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.like) == -1
+    assert await cache.get_cache_reactions("p1") is None
+
+
+async def test_reaction_is_added_once(redis):
+    await cache.update_cache_reactions(loaded(dislikes={"u2"}), "p1")
+
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.like) == 1
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.dislike) == 0
+    assert await cache.add_cache_reaction("p1", "u2", ReactionType.like) == 0
+
+    reactions, stale = await cache.get_cache_reactions("p1")
+    assert reactions == loaded(likes={"u1"}, dislikes={"u2"})
+    assert not stale
+    assert await get_counts("p1") == [1, 1]
+
+
+async def test_loaded_reactions_are_merged(redis):
+    await cache.update_cache_reactions(loaded(), "p1")
+    await cache.add_cache_reaction("p1", "u1", ReactionType.like)
+
+    # Loaded before u1 reacted.
+    await cache.update_cache_reactions(loaded(likes={"u2"}), "p1")
+
+    reactions, _ = await cache.get_cache_reactions("p1")
+    assert reactions == loaded(likes={"u1", "u2"})
+    assert await get_counts("p1") == [2, 0]
+
+
+async def test_pending_reactions_survive_rebuild(redis):
+    await cache.update_cache_reactions(loaded(), "p1")
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True) == 1
+    assert await redis.xlen(settings.REACTIONS_STREAM) == 1
+
+    # Cached reactions expire before the reaction is flushed.
+    await cache.delete_cache_reactions("p1")
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.dislike, enqueue=True) == 0
+    await cache.update_cache_reactions(loaded(), "p1")
+
+    reactions, _ = await cache.get_cache_reactions("p1")
+    assert reactions == loaded(likes={"u1"})
+    assert await get_counts("p1") == [1, 0]
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True) == 0
+    assert await redis.xlen(settings.REACTIONS_STREAM) == 1
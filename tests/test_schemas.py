@@ -0,0 +1,30 @@
+import json
+import uuid
+from datetime import datetime
+
+from posts.schemas import PostDetail
+from posts.utils import content_etag
+
+
+def post_detail(reactions):
+    date = datetime(2020, 1, 1)
+    return PostDetail.model_construct(
+        id=uuid.uuid4(),
+        owner_id=uuid.uuid4(),
+        title="title",
+        description=None,
+        creation_date=date,
+        last_update_date=date,
+        like_count=len(reactions["like"]),
+        dislike_count=len(reactions["dislike"]),
+        reactions=reactions,
+    )
+
+
+def test_reactions_are_serialized_in_stable_order():
+    post = post_detail({"like": {"b", "c", "a"}, "dislike": {"e", "d"}})
+    same_post = post.model_copy(update={"reactions": {"dislike": {"d", "e"}, "like": {"c", "a", "b"}}})
+
+    body = post.__pydantic_serializer__.to_json(post)
+    assert json.loads(body)["reactions"] == {"like": ["a", "b", "c"], "dislike": ["d", "e"]}
+    assert content_etag(body) == content_etag(same_post.__pydantic_serializer__.to_json(same_post))
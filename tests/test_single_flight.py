@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from cache_base import single_flight
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def read_nothing():
+    return None
+
+
+async def test_concurrent_callers_share_load(redis):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    results = await asyncio.gather(*(single_flight.do("key", load, read_nothing) for _ in range(3)))
+
+    assert results == ["value"] * 3
+    assert len(calls) == 1
+
+
+async def test_waiter_takes_over_cancelled_load(redis):
+    started = asyncio.Event()
+
+    async def slow_load():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def load():
+        return "value"
+
+    leader = asyncio.ensure_future(single_flight.do("key", slow_load, read_nothing))
+    await started.wait()
+    waiter = asyncio.ensure_future(single_flight.do("key", load, read_nothing))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await asyncio.wait_for(waiter, 5) == "value"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
@@ -0,0 +1,90 @@
+import pytest
+
+from cache_base import MISSING, build_key, redis_client, tag_cache
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def store(key, tags, load_tags=(), invalidated=()):
+    """Snapshot, invalidate the given tags "while loading", then store the response."""
+    snapshot = await tag_cache.snapshot(*tags)
+    if invalidated:
+        await tag_cache.invalidate(*invalidated)
+    await tag_cache.set(key, "etag", b"body", [*tags, *load_tags], snapshot)
+
+
+async def test_stored_response_is_served(redis):
+    await store("page", ["posts:offset"], ["post:1"])
+
+    assert await tag_cache.get("page") == ("etag", b"body")
+    # The client already has the response.
+    assert await tag_cache.get("page", ["other", "etag"]) == ("etag", None)
+
+
+async def test_invalidated_response_is_not_served(redis):
+    await store("page", ["posts:offset"], ["post:1", "post:2"])
+    await tag_cache.invalidate("post:2")
+    assert await tag_cache.get("page") is None
+
+    await store("page", ["posts:offset"], ["post:1", "post:2"])
+    await tag_cache.invalidate("posts:offset")
+    assert await tag_cache.get("page") is None
+
+
+async def test_response_loaded_during_invalidation_is_not_stored(redis):
+    await store("post", ["post:1"], invalidated=["post:1"])
+    await store("page", ["posts:offset"], ["post:1"], invalidated=["post:1"])
+
+    assert await tag_cache.get("post") is None
+    assert await tag_cache.get("page") is None
+
+
+async def test_unrelated_invalidations_dont_block_storing(redis):
+    await tag_cache.invalidate("post:1")
+    await store("page", ["posts:offset"], ["post:1", "post:2"], invalidated=["post:3"])
+
+    assert await tag_cache.get("page") == ("etag", b"body")
+
+
+async def test_lost_generation_doesnt_reuse_versions(redis):
+    await tag_cache.invalidate("post:1")
+    version = int(await redis.get(build_key("tag", "post:1")))
+    await redis.delete(tag_cache.GENERATION_KEY)
+
+    await tag_cache.invalidate("post:1")
+
+    assert int(await redis.get(build_key("tag", "post:1"))) > version
+
+
+async def test_hot_response_is_served_in_process(redis):
+    await store("page", ["posts:offset"], ["post:1"])
+    await redis.flushall()
+
+    assert await tag_cache.get("page") == ("etag", b"body")
+
+    await tag_cache.invalidate("post:1")
+    assert await tag_cache.get("page") is None
+
+
+async def test_response_read_before_invalidation_is_not_kept_in_process(redis, monkeypatch):
+    await store("page", ["posts:offset"], ["post:1"])
+    redis_client.local.clear()
+    get_script = tag_cache._get
+
+    async def get_and_invalidate(**kwargs):
+        entry = await get_script(**kwargs)
+        # Invalidation message of another worker arrives while the response is read.
+        redis_client.local.delete(build_key("tag", "post:1"))
+        return entry
+
+    monkeypatch.setattr(tag_cache, "_get", get_and_invalidate)
+    assert await tag_cache.get("page") == ("etag", b"body")
+    assert redis_client.local.get(build_key("response", "page")) is MISSING
+
+
+async def test_response_lifetime(redis):
+    snapshot = await tag_cache.snapshot("post:1")
+    await tag_cache.set("post", "etag", b"body", ["post:1"], snapshot, lifetime_sec=5)
+
+    assert 0 < await redis.ttl(build_key("response", "post")) <= 5
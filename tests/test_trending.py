@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+import settings
+from posts import trending
+from posts.models import ReactionType
+from posts.trending import TrendingWindow
+
+
+pytestmark = pytest.mark.anyio
+
+
+def counts(likes: int = 0, dislikes: int = 0):
+    return {"like": likes, "dislike": dislikes}
+
+
+async def test_add_scores_updates_all_windows(redis):
+    await trending.add_reaction_scores(
+        [("p1", ReactionType.like), ("p2", ReactionType.dislike)],
+        {"p1": counts(likes=3), "p2": counts(dislikes=1)},
+    )
+
+    for window in (TrendingWindow.hour, TrendingWindow.day):
+        top = dict(await trending.get_top(window, 10))
+        assert top["p1"] == pytest.approx(1, rel=1e-3)
+        assert top["p2"] == pytest.approx(-1, rel=1e-3)
+    # Not decaying score is taken from the counters.
+    assert await trending.get_top(TrendingWindow.all, 10) == [("p1", 3), ("p2", -1)]
+
+
+async def test_negligible_scores_leave_decaying_windows(redis):
+    await trending.add_reaction_scores([("p1", ReactionType.like)], {"p1": counts(likes=1)})
+    await trending.add_reaction_scores(
+        [("p1", ReactionType.dislike)], {"p1": counts(likes=1, dislikes=1)}
+    )
+
+    assert await trending.get_top(TrendingWindow.hour, 10) == []
+    assert await trending.get_top(TrendingWindow.day, 10) == []
+    assert await trending.get_top(TrendingWindow.all, 10) == [("p1", 0)]
+
+
+async def test_full_window_admits_new_posts(redis, monkeypatch):
+    monkeypatch.setattr(settings, "TRENDING_MAX_POSTS", 2)
+    for post_id, likes in (("p1", 1), ("p2", 2), ("p3", 5)):
+        await trending.add_reaction_scores(
+            [(post_id, ReactionType.like)], {post_id: counts(likes=likes)}
+        )
+
+    assert await trending.get_top(TrendingWindow.all, 10) == [("p3", 5), ("p2", 2)]
+    # Decaying windows are not trimmed by rank.
+    assert len(await trending.get_top(TrendingWindow.hour, 10)) == 3
+
+
+async def test_scores_are_rescaled(redis, monkeypatch):
+    monkeypatch.setattr(trending, "RESCALE_EXPONENT", 2)
+    key = trending.window_key(TrendingWindow.hour)
+    half_life = trending.HALF_LIFE_SEC[TrendingWindow.hour]
+    # A reaction weighted up by 2 ** 3 three half-lives ago.
+    await redis.hset(trending.EPOCHS_KEY, key, time.time() - 3 * half_life)
+    await redis.zadd(key, {"p1": 8})
+
+    await trending.add_reaction_scores([("p2", ReactionType.like)], {"p2": counts(likes=1)})
+
+    assert float(await redis.hget(trending.EPOCHS_KEY, key)) == pytest.approx(time.time(), abs=5)
+    assert await redis.zscore(key, "p1") == pytest.approx(1, rel=1e-3)
+    top = dict(await trending.get_top(TrendingWindow.hour, 10))
+    assert top == {"p1": pytest.approx(1, rel=1e-3), "p2": pytest.approx(1, rel=1e-3)}
@@ -0,0 +1,56 @@
+import uuid
+
+import pytest
+
+from auth.cache import get_cache_user, invalidate_cache_user, update_cache_user
+from auth.models import User
+from cache_base import redis_client
+
+
+pytestmark = pytest.mark.anyio
+
+
+def make_user(user_id, is_active=True):
+    return User(
+        id=user_id,
+        email="user@example.com",
+        username="user",
+        is_active=is_active,
+        is_superuser=False,
+        is_verified=False,
+    )
+
+
+async def test_loaded_user_is_cached(redis):
+    user_id = uuid.uuid4()
+    user, version = await get_cache_user(user_id)
+    assert user is None
+
+    await update_cache_user(make_user(user_id), version)
+    redis_client.local.clear()
+    user, _ = await get_cache_user(user_id)
+    assert user.id == user_id and user.is_active
+
+
+async def test_invalidated_user_is_not_served(redis):
+    user_id = uuid.uuid4()
+    _, version = await get_cache_user(user_id)
+    await update_cache_user(make_user(user_id), version)
+
+    await invalidate_cache_user(user_id)
+    assert await get_cache_user(user_id) == (None, "1")
+
+
+async def test_user_loaded_before_invalidation_is_not_cached(redis):
+    user_id = uuid.uuid4()
+    _, version = await get_cache_user(user_id)
+    # The user is deactivated while the old row is being loaded.
+    stale = make_user(user_id)
+    await invalidate_cache_user(user_id)
+    await update_cache_user(stale, version)
+
+    user, version = await get_cache_user(user_id)
+    assert user is None
+    await update_cache_user(make_user(user_id, is_active=False), version)
+    user, _ = await get_cache_user(user_id)
+    assert not user.is_active
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import settings
+from posts import cache, write_behind
+from posts.models import ReactionType
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def stream(redis):
+    await redis.xgroup_create(
+        settings.REACTIONS_STREAM, settings.REACTIONS_STREAM_GROUP, id="0", mkstream=True
+    )
+    await cache.update_cache_reactions({"like": set(), "dislike": set()}, "p1")
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Reactions saved to db, reactions of the user "deleted" violate foreign key."""
+    saved = []
+
+    async def insert_reactions(reactions):
+        if any(user_id == "deleted" for _, user_id, _ in reactions):
+            raise IntegrityError("INSERT INTO reaction", {}, Exception("foreign key violation"))
+        saved.extend(reactions)
+        return {(post_id, user_id) for post_id, user_id, _ in reactions}
+
+    monkeypatch.setattr(write_behind, "insert_reactions", insert_reactions)
+    return saved
+
+
+async def read_entries(redis):
+    response = await redis.xreadgroup(
+        settings.REACTIONS_STREAM_GROUP, "test", {settings.REACTIONS_STREAM: ">"}
+    )
+    return response[0][1]
+
+
+async def test_flushed_reactions_are_acknowledged(redis, stream, saved):
+    await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True)
+    await cache.add_cache_reaction("p1", "u2", ReactionType.dislike, enqueue=True)
+
+    await write_behind.save_entries(await read_entries(redis))
+
+    assert saved == [("p1", "u1", ReactionType.like), ("p1", "u2", ReactionType.dislike)]
+    assert await redis.xlen(settings.REACTIONS_STREAM) == 0
+    pending = await redis.xpending(settings.REACTIONS_STREAM, settings.REACTIONS_STREAM_GROUP)
+    assert pending["pending"] == 0
+    assert await redis.hgetall(cache.pending_key("p1")) == {}
+    # Saved reactions are still deduplicated by the cached ones.
+    assert await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True) == 0
+
+
+async def test_failing_reactions_are_dead_lettered(redis, stream, saved):
+    await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True)
+    await cache.add_cache_reaction("p1", "deleted", ReactionType.like, enqueue=True)
+    await redis.xadd(settings.REACTIONS_STREAM, {"post_id": "p1", "user_id": "u3", "type": "love"})
+
+    await write_behind.save_entries(await read_entries(redis))
+
+    assert saved == [("p1", "u1", ReactionType.like)]
+    assert await redis.xlen(settings.REACTIONS_STREAM) == 0
+    dead = [fields for _, fields in await redis.xrange(settings.REACTIONS_DEAD_LETTER_STREAM)]
+    assert [fields[b"user_id"] for fields in dead] == [b"deleted", b"u3"]
+    assert b"foreign key violation" in dead[0][b"error"]
+    assert await redis.hgetall(cache.pending_key("p1")) == {}
+
+
+async def test_flusher_finishes_batch_on_stop(redis, stream, monkeypatch):
+    started = asyncio.Event()
+    saved = []
+
+    async def insert_reactions(reactions):
+        started.set()
+        await asyncio.sleep(0.1)
+        saved.extend(reactions)
+        return set()
+
+    monkeypatch.setattr(write_behind, "insert_reactions", insert_reactions)
+    await cache.add_cache_reaction("p1", "u1", ReactionType.like, enqueue=True)
+
+    await write_behind.start_flusher()
+    await asyncio.wait_for(started.wait(), 5)
+    await write_behind.stop_flusher()
+
+    assert saved == [("p1", "u1", ReactionType.like)]
+    assert await redis.xlen(settings.REACTIONS_STREAM) == 0